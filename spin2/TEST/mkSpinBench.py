@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+import sys
+import os
+import argparse
+import random
+import json
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import platform
+
+from time import localtime, strftime
+from colorama import Fore, Style
+
+# v0.0.1 - synthetic corpus + marks generator, per-phase timings of mkSpinList.py as JSON
+
+script_version  = "0.0.1"
+script_name     = 'mkSpinBench.py'
+script_info     = '{} v{}'.format(script_name, script_version)
+project_name    = 'Benchmark mkSpinList.py on a synthetic spin/spin2 tree'
+project_url     = ''
+
+# -----------------------------------------------------------------------------
+#   Colorama constants:
+#  Fore: BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE, RESET.
+#  Back: BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE, RESET.
+#  Style: DIM, NORMAL, BRIGHT, RESET_ALL
+#
+# Logging function
+def print_line(text, error=False, warning=False, info=False, verbose=False, debug=False, console=True):
+    timestamp = strftime('%Y-%m-%d %H:%M:%S', localtime())
+    if console:
+        if error:
+            print(Fore.RED + Style.BRIGHT + '[{}] '.format(timestamp) + Style.NORMAL + '{}'.format(text) + Style.RESET_ALL, file=sys.stderr)
+        elif warning:
+            print(Fore.YELLOW + Style.BRIGHT + '[{}] '.format(timestamp) + Style.NORMAL + '{}'.format(text) + Style.RESET_ALL)
+        elif info or verbose:
+            if verbose:
+                # conditional verbose output...
+                if opt_verbose:
+                    print(Fore.GREEN + '[{}] '.format(timestamp) + Fore.YELLOW  + '- ' + '{}'.format(text) + Style.RESET_ALL)
+            else:
+                # info...
+                print(Fore.MAGENTA + '[{}] '.format(timestamp) + Fore.WHITE  + '- ' + '{}'.format(text) + Style.RESET_ALL)
+        elif debug:
+            # conditional debug output...
+            if opt_debug:
+                print(Fore.CYAN + '[{}] '.format(timestamp) + '- (DBG): ' + '{}'.format(text) + Style.RESET_ALL)
+        else:
+            print(Fore.GREEN + '[{}] '.format(timestamp) + Style.RESET_ALL + '{}'.format(text) + Style.RESET_ALL)
+
+# -----------------------------------------------------------------------------
+
+# Argparse
+opt_debug = False
+opt_verbose = False
+
+default_files = 10000
+default_per_folder = 40
+default_depth = 12
+default_dup_ratio = 0.25
+default_collide_ratio = 0.1
+default_marks_ratio = 0.3
+default_runs = 3
+default_threshold = 0.10
+shapeNames = ['wide', 'deep']
+
+parser = argparse.ArgumentParser(description=project_name, epilog='For further details see: ' + project_url)
+parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+parser.add_argument("-d", "--debug", help="show debug output", action="store_true")
+parser.add_argument("-o", "--outfile", help="specify results file name (JSON)", default='')
+parser.add_argument("-n", "--files", help="number of spin files to generate (default: {})".format(default_files), type=int, default=default_files)
+parser.add_argument("--shape", help="tree shape: many sibling folders (wide) or long folder chains (deep) (default: wide)", choices=shapeNames, default='wide')
+parser.add_argument("--per-folder", help="spin files per folder (default: {})".format(default_per_folder), type=int, default=default_per_folder)
+parser.add_argument("--depth", help="folders per chain for --shape deep (default: {})".format(default_depth), type=int, default=default_depth)
+parser.add_argument("--dup-ratio", help="fraction of files that copy an earlier file's content (default: {})".format(default_dup_ratio), type=float, default=default_dup_ratio)
+parser.add_argument("--collide-ratio", help="fraction of files given a common name like demo.spin2 (default: {})".format(default_collide_ratio), type=float, default=default_collide_ratio)
+parser.add_argument("--marks-ratio", help="fraction of listed files given a @done mark in the marks file (default: {})".format(default_marks_ratio), type=float, default=default_marks_ratio)
+parser.add_argument("--seed", help="random seed, the same seed builds the same corpus (default: 1)", type=int, default=1)
+parser.add_argument("--corpus", help="build (or reuse) the corpus in this folder instead of a temporary one", default='')
+parser.add_argument("--runs", help="number of timed runs, best of each is reported (default: {})".format(default_runs), type=int, default=default_runs)
+parser.add_argument("--scan-args", help="extra mkSpinList.py arguments, e.g. --scan-args=\"--full-digests -j 8\"", default='')
+parser.add_argument("--compare", help="compare against a prior results file and exit 1 on a regression", default='')
+parser.add_argument("--threshold", help="slowdown (fraction) counted as a regression by --compare (default: {})".format(default_threshold), type=float, default=default_threshold)
+parse_args = parser.parse_args()
+
+opt_verbose = parse_args.verbose
+opt_debug = parse_args.debug
+results_filename = parse_args.outfile
+corpus_dirspec = parse_args.corpus
+compare_filename = parse_args.compare
+scanArgs = shlex.split(parse_args.scan_args)
+corpusParams = {
+    'files': parse_args.files,
+    'shape': parse_args.shape,
+    'perFolder': max(parse_args.per_folder, 1),
+    'depth': max(parse_args.depth, 1),
+    'dupRatio': parse_args.dup_ratio,
+    'collideRatio': parse_args.collide_ratio,
+    'marksRatio': parse_args.marks_ratio,
+    'seed': parse_args.seed,
+}
+
+print_line(script_info, info=True)
+
+scanner_filespec = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mkSpinList.py')
+if not os.path.isfile(scanner_filespec):
+    print_line('ERROR: mkSpinList.py not found next to us [{}]'.format(scanner_filespec), error=True)
+    os._exit(1)
+
+# -----------------------------------------------------------------------------
+#  Synthetic corpus
+# -----------------------------------------------------------------------------
+#  Files are assembled from a bank of plausible spin lines so building a
+#  million of them stays quick.  Each unique file starts with its own
+#  numbered line; a duplicate copies an earlier file's bytes exactly.
+#  Sizes vary widely, so the scanner's size staging sees both unique and
+#  colliding sizes.  The same seed always builds the same tree.
+corpusInfoFilename = 'bench-corpus.json'
+collidingNames = ['demo.spin2', 'main.spin2', 'test.spin2', 'jm_serial.spin2', 'FullDuplexSerial.spin', 'isp_hub75_display.spin2']
+dupContentsKept = 2000
+
+def spinLineBank(rng):
+    identifiers = ['tx', 'rx', 'baud', 'pin', 'count', 'value', 'buffer', 'index', 'state', 'delay', 'color', 'x', 'y', 'mode']
+    bankLines = []
+    for section in ['CON', 'VAR', 'OBJ', 'PUB', 'PRI', 'DAT']:
+        bankLines.append('{} '.format(section))
+        for lineNbr in range(64):
+            name1 = rng.choice(identifiers)
+            name2 = rng.choice(identifiers)
+            if section == 'CON':
+                bankLines.append('  {}_{} = {}'.format(name1.upper(), lineNbr, rng.randrange(1 << 16)))
+            elif section == 'VAR':
+                bankLines.append('  long {}{}[{}]'.format(name1, lineNbr, rng.randrange(1, 64)))
+            elif section == 'OBJ':
+                bankLines.append('  {}{} : "{}_{}"'.format(name1, lineNbr, name2, lineNbr))
+            elif section == 'DAT':
+                bankLines.append('{}{}    long    ${:08x}'.format(name1, lineNbr, rng.randrange(1 << 32)))
+            else:
+                bankLines.append('  {} := {} + {}  \' {} it'.format(name1, name2, lineNbr, rng.choice(['adjust', 'update', 'check'])))
+    return bankLines
+
+def corpusFolderOf(folderNbr):
+    # relative folder of the folderNbr'th folder for our tree shape
+    if corpusParams['shape'] == 'wide':
+        return 'obj{:06d}'.format(folderNbr)
+    chainNbr, levelNbr = divmod(folderNbr, corpusParams['depth'])
+    levelNames = ['lvl{:02d}'.format(level) for level in range(1, levelNbr + 1)]
+    return os.path.join('obj{:06d}'.format(chainNbr), *levelNames)
+
+def buildCorpus(corpusDirSpec):
+    rng = random.Random(corpusParams['seed'])
+    bankLines = spinLineBank(rng)
+    rootDirSpec = os.path.join(corpusDirSpec, 'All')
+    keptContents = []
+    counts = {'files': 0, 'dirs': 0, 'bytes': 0, 'dupFiles': 0, 'collidingFiles': 0}
+    folderNbr = 0
+    while counts['files'] < corpusParams['files']:
+        folderSpec = os.path.join(rootDirSpec, corpusFolderOf(folderNbr))
+        os.makedirs(folderSpec, exist_ok=True)
+        counts['dirs'] += 1
+        # a non-spin file in every folder, the scanner has to skip these
+        with open(os.path.join(folderSpec, 'readme.txt'), 'w') as readme_fp:
+            readme_fp.write('folder {}\n'.format(folderNbr))
+        usedNames = set()
+        nbrFiles = min(corpusParams['perFolder'], corpusParams['files'] - counts['files'])
+        for fileNbr in range(nbrFiles):
+            filename = None
+            if rng.random() < corpusParams['collideRatio']:
+                filename = rng.choice(collidingNames)
+                if filename in usedNames:
+                    filename = None
+                else:
+                    counts['collidingFiles'] += 1
+            if filename is None:
+                filename = 'f{:06d}_{:03d}.{}'.format(folderNbr, fileNbr, 'spin' if rng.random() < 0.3 else 'spin2')
+            usedNames.add(filename)
+            if len(keptContents) > 0 and rng.random() < corpusParams['dupRatio']:
+                fileBytes = rng.choice(keptContents)
+                counts['dupFiles'] += 1
+            else:
+                nbrLines = int(rng.expovariate(1.0 / 120)) + 8
+                fileLines = ["' synthetic file {}/{}".format(folderNbr, fileNbr)]
+                fileLines.extend(rng.choices(bankLines, k=nbrLines))
+                fileBytes = '\r\n'.join(fileLines).encode('utf-8')
+                if len(keptContents) < dupContentsKept:
+                    keptContents.append(fileBytes)
+                else:
+                    keptContents[rng.randrange(dupContentsKept)] = fileBytes
+            with open(os.path.join(folderSpec, filename), 'wb') as spin_fp:
+                spin_fp.write(fileBytes)
+            counts['files'] += 1
+            counts['bytes'] += len(fileBytes)
+        folderNbr += 1
+        if folderNbr % 1000 == 0:
+            print_line('Corpus: {} of {} files'.format(counts['files'], corpusParams['files']), verbose=True)
+    return counts
+
+def marksFromListing(listingFileSpec, marksFileSpec):
+    # the marks file is a listing as TaskPaper saves it (leading space -> tab)
+    #  with @done marks and notes on some of its files
+    rng = random.Random(corpusParams['seed'] + 1)
+    countPattern = re.compile(r' \[\d+,\d+\]$')
+    nbrMarks = 0
+    with open(listingFileSpec, 'r') as listing_fp, open(marksFileSpec, 'w') as marks_fp:
+        for listingLine in listing_fp:
+            listingLine = listingLine.rstrip('\n')
+            if listingLine.startswith('Stats for FOLDER:'):
+                break
+            if listingLine.startswith(' '):
+                listingLine = '\t' + listingLine[1:]
+            if listingLine.startswith('\t\t- ') and rng.random() < corpusParams['marksRatio']:
+                marks_fp.write('{} @done(2024-{:02d}-{:02d})\n'.format(countPattern.sub('', listingLine), rng.randrange(1, 13), rng.randrange(1, 29)))
+                nbrMarks += 1
+                if rng.random() < 0.3:
+                    marks_fp.write('\t\t\t- checked on P2 EVAL\n')
+                continue
+            marks_fp.write('{}\n'.format(listingLine))
+    return nbrMarks
+
+def prepareCorpus(corpusDirSpec):
+    # reuse a corpus built earlier with the same parameters
+    corpusInfoFileSpec = os.path.join(corpusDirSpec, corpusInfoFilename)
+    try:
+        with open(corpusInfoFileSpec, 'r') as info_fp:
+            corpusInfo = json.load(info_fp)
+        if corpusInfo.get('params') == corpusParams:
+            print_line('Reusing corpus [{}]'.format(corpusDirSpec), info=True)
+            return corpusInfo
+    except (OSError, ValueError):
+        pass
+    rootDirSpec = os.path.join(corpusDirSpec, 'All')
+    if os.path.isdir(rootDirSpec):
+        shutil.rmtree(rootDirSpec)
+    print_line('Building {} corpus of {} files in [{}]'.format(corpusParams['shape'], corpusParams['files'], corpusDirSpec), info=True)
+    counts = buildCorpus(corpusDirSpec)
+    # a first (untimed) scan lists the tree for our marks file
+    listingFileSpec = os.path.join(corpusDirSpec, 'listing.taskpaper')
+    runScanner(['-r', rootDirSpec, '-o', listingFileSpec])
+    counts['marks'] = marksFromListing(listingFileSpec, os.path.join(corpusDirSpec, 'marks.taskpaper'))
+    corpusInfo = {'params': corpusParams, 'counts': counts}
+    with open(corpusInfoFileSpec, 'w') as info_fp:
+        json.dump(corpusInfo, info_fp, indent=1)
+    print_line('Corpus: {files} files ({bytes} bytes) in {dirs} folders, {dupFiles} duplicates, {collidingFiles} common names, {marks} marks'.format(**counts), info=True)
+    return corpusInfo
+
+# -----------------------------------------------------------------------------
+#  Timed runs
+# -----------------------------------------------------------------------------
+def runScanner(scannerArgs):
+    commandLine = [sys.executable, scanner_filespec] + scannerArgs
+    print_line('Running {}'.format(' '.join(shlex.quote(arg) for arg in commandLine)), verbose=True)
+    completed = subprocess.run(commandLine, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        print_line('ERROR: mkSpinList.py failed ({}): {}'.format(completed.returncode, completed.stderr.strip()), error=True)
+        os._exit(1)
+
+def timedRun(corpusDirSpec, runNbr):
+    timingsFileSpec = os.path.join(corpusDirSpec, 'timings-{}.json'.format(runNbr))
+    runScanner(['-r', os.path.join(corpusDirSpec, 'All'),
+                '-f', os.path.join(corpusDirSpec, 'marks.taskpaper'),
+                '-o', os.path.join(corpusDirSpec, 'bench-{}.taskpaper'.format(runNbr)),
+                '--timings', timingsFileSpec] + scanArgs)
+    with open(timingsFileSpec, 'r') as timings_fp:
+        timings = json.load(timings_fp)
+    timings['filesPerSec'] = round(timings['counts']['spinFiles'] / timings['total'], 1) if timings['total'] > 0 else 0.0
+    print_line('Run {}: {:.3f}s total, {:.0f} files/sec, {}  peak RSS {} KiB'.format(runNbr, timings['total'], timings['filesPerSec'],
+               ', '.join('{} {:.3f}s'.format(phaseName, seconds) for phaseName, seconds in timings['phases'].items()), timings['peakRssKb']), info=True)
+    return timings
+
+def bestOfRuns(runTimings):
+    # fastest of each phase, the runs mostly differ by noise
+    phaseNames = []
+    for timings in runTimings:
+        phaseNames.extend(phaseName for phaseName in timings['phases'] if phaseName not in phaseNames)
+    best = {'phases': {}}
+    for phaseName in phaseNames:
+        best['phases'][phaseName] = min(timings['phases'].get(phaseName, 0.0) for timings in runTimings)
+    best['total'] = min(timings['total'] for timings in runTimings)
+    best['filesPerSec'] = max(timings['filesPerSec'] for timings in runTimings)
+    peakRssValues = [timings['peakRssKb'] for timings in runTimings if timings['peakRssKb'] is not None]
+    best['peakRssKb'] = max(peakRssValues) if len(peakRssValues) > 0 else None
+    return best
+
+# -----------------------------------------------------------------------------
+#  Comparing results
+# -----------------------------------------------------------------------------
+#  Phases shorter than compareNoiseSeconds are too short to judge reliably.
+compareNoiseSeconds = 0.05
+
+def compareResults(priorResults, results):
+    priorBest = priorResults['best']
+    best = results['best']
+    if priorResults.get('corpus', {}).get('params') != results['corpus']['params']:
+        print_line('WARNING: results were taken on differently built corpora', warning=True)
+    regressions = []
+    measures = [(phaseName, priorBest['phases'].get(phaseName), best['phases'][phaseName]) for phaseName in best['phases']]
+    measures.append(('total', priorBest['total'], best['total']))
+    for measureName, priorSeconds, seconds in measures:
+        if priorSeconds is None:
+            print_line('  {:<8} {:>9} -> {:8.3f}s  (new)'.format(measureName, '', seconds), info=True)
+            continue
+        change = (seconds - priorSeconds) / priorSeconds if priorSeconds > 0 else 0.0
+        isRegression = change > parse_args.threshold and seconds - priorSeconds > compareNoiseSeconds
+        message = '  {:<8} {:8.3f}s -> {:8.3f}s  {:+6.1f}%'.format(measureName, priorSeconds, seconds, 100.0 * change)
+        if isRegression:
+            regressions.append(measureName)
+            print_line(message + '  REGRESSION', error=True)
+        else:
+            print_line(message, info=True)
+    if priorBest.get('peakRssKb') and best.get('peakRssKb'):
+        print_line('  {:<8} {:8d}K -> {:8d}K'.format('peakRSS', priorBest['peakRssKb'], best['peakRssKb']), info=True)
+    return regressions
+
+# -----------------------------------------------------------------------------
+#  Main
+# -----------------------------------------------------------------------------
+usingTempCorpus = len(corpus_dirspec) == 0
+if usingTempCorpus:
+    corpus_dirspec = tempfile.mkdtemp(prefix='mkSpinBench-')
+corpus_dirspec = os.path.abspath(corpus_dirspec)
+os.makedirs(corpus_dirspec, exist_ok=True)
+
+corpusInfo = prepareCorpus(corpus_dirspec)
+runTimings = [timedRun(corpus_dirspec, runNbr) for runNbr in range(1, max(parse_args.runs, 1) + 1)]
+results = {
+    'bench': script_info,
+    'when': strftime('%Y-%m-%dT%H:%M:%S', localtime()),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'scanArgs': scanArgs,
+    'corpus': corpusInfo,
+    'runs': runTimings,
+    'best': bestOfRuns(runTimings),
+}
+print_line('Best: {:.3f}s total, {:.0f} files/sec'.format(results['best']['total'], results['best']['filesPerSec']), info=True)
+
+if len(results_filename) > 0:
+    with open(results_filename, 'w') as results_fp:
+        json.dump(results, results_fp, indent=1)
+    print_line('Results written to [{}]'.format(results_filename), info=True)
+
+if usingTempCorpus:
+    shutil.rmtree(corpus_dirspec, ignore_errors=True)
+
+if len(compare_filename) > 0:
+    with open(compare_filename, 'r') as prior_fp:
+        priorResults = json.load(prior_fp)
+    print_line('Compared to [{}] ({}):'.format(compare_filename, priorResults.get('when', '?')), info=True)
+    regressions = compareResults(priorResults, results)
+    if len(regressions) > 0:
+        print_line('{} measure(s) regressed: {}'.format(len(regressions), ', '.join(regressions)), error=True)
+        sys.exit(1)
@@ -0,0 +1,3338 @@
+#!/usr/bin/env python3
+import sys
+import os
+import re
+import threading
+import zlib
+import operator
+import codecs
+import atexit
+
+from time import time, sleep, localtime, strftime, perf_counter
+# hashlib, sqlite3, json, zipfile, tempfile, concurrent.futures, cProfile and
+#  colorama are imported where first needed, so importing us (or --help)
+#  doesn't pay for modules a run may never use
+
+# v0.0.1 - awaken email send
+# v0.0.2 - add file handling
+# v0.0.3 - in-process (hashlib) parallel hashing, selectable digest
+# v0.0.4 - persistent digest cache (-c) so unchanged files are not re-read
+# v0.0.5 - single-pass os.scandir() walker, no recursion
+# v0.0.6 - indexed marks lookup, ambiguous marks reported at end of run
+# v0.0.7 - typed inventory model (no more string-encoded counters)
+# v0.0.8 - filename -> digests index, --versions lists folders of each version
+# v0.0.9 - scan state (-s) for incremental rescans with a delta report
+# v0.0.10 - near-duplicate (MinHash/LSH) detection of spin sources (--similar)
+# v0.0.11 - normalized-content digests in the same read pass (--normalized)
+# v0.0.12 - staged dedupe (size -> partial -> full digest), --full-digests
+# v0.0.13 - streaming JSON Lines (--jsonl) and SQLite (--sqlite) inventory export
+# v0.0.14 - buffered, atomically replaced output files
+# v0.0.15 - multi-root batch mode (--batch) with a cross-root summary
+# v0.0.16 - list spin files inside .zip archives without extracting (--zips)
+# v0.0.17 - per-phase timings written as JSON (--timings), see mkSpinBench.py
+# v0.0.18 - per-phase stats (--stats), cProfile dump (--profile), live progress
+# v0.0.19 - importable: scan() API and main() entry point, deferred imports
+# v0.0.20 - streaming marks file parser (typed records) and round-trip writer
+# v0.0.21 - spin structure metadata (lines, sections, PASM ratio, Spin2-ness) in the digest read (--metadata)
+# v0.0.22 - OBJ dependency graph in the SQLite export (--deps), queried with --uses and --unresolved
+# v0.0.23 - gitignore-style --exclude/--include/--ignore-file rules, pruning before any I/O
+# v0.0.24 - report written by pluggable sections from one bucketing pass, add --top and --sections
+# v0.0.25 - list folders ahead of the walk on a thread pool (--walk-jobs) for synced/network file systems
+# v0.0.26 - memory-bounded mode (--max-memory): inventory kept in an on-disk store, report sorted on disk
+# v0.0.27 - checkpoints during long walks (--checkpoint-every) and --resume with identical output
+
+script_version  = "0.0.27"
+script_name     = 'mkSpinList.py'
+script_info     = '{} v{}'.format(script_name, script_version)
+project_name    = 'Make List of spin/spin2 files for certification'
+project_url     = ''
+
+if False:
+    # will be caught by python 2.7 to be illegal syntax
+    print_line('Sorry, this script requires a python3 runtime environment.', file=sys.stderr)
+    os._exit(1)
+
+# -----------------------------------------------------------------------------
+# the ABOVE are identical to that found in our gateway .spin2 object
+# -----------------------------------------------------------------------------
+#   Colorama constants:
+#  Fore: BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE, RESET.
+#  Back: BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE, RESET.
+#  Style: DIM, NORMAL, BRIGHT, RESET_ALL
+#
+# colorama is only loaded when we're writing to a terminal
+Fore = None
+Style = None
+
+class NoColor:
+    # stands in for colorama's Fore/Style: every color is ''
+    def __getattr__(self, name):
+        return ''
+
+def loadColors():
+    global Fore
+    global Style
+    if sys.stdout.isatty() or sys.stderr.isatty():
+        from colorama import Fore, Style
+    else:
+        Fore = NoColor()
+        Style = Fore
+
+# Logging function
+def print_line(text, error=False, warning=False, info=False, verbose=False, debug=False, console=True):
+    if Fore is None:
+        loadColors()
+    timestamp = strftime('%Y-%m-%d %H:%M:%S', localtime())
+    if console:
+        if error:
+            print(Fore.RED + Style.BRIGHT + '[{}] '.format(timestamp) + Style.NORMAL + '{}'.format(text) + Style.RESET_ALL, file=sys.stderr)
+        elif warning:
+            print(Fore.YELLOW + Style.BRIGHT + '[{}] '.format(timestamp) + Style.NORMAL + '{}'.format(text) + Style.RESET_ALL)
+        elif info or verbose:
+            if verbose:
+                # conditional verbose output...
+                if opt_verbose:
+                    print(Fore.GREEN + '[{}] '.format(timestamp) + Fore.YELLOW  + '- ' + '{}'.format(text) + Style.RESET_ALL)
+            else:
+                # info...
+                print(Fore.MAGENTA + '[{}] '.format(timestamp) + Fore.WHITE  + '- ' + '{}'.format(text) + Style.RESET_ALL)
+        elif debug:
+            # conditional debug output...
+            if opt_debug:
+                print(Fore.CYAN + '[{}] '.format(timestamp) + '- (DBG): ' + '{}'.format(text) + Style.RESET_ALL)
+        else:
+            print(Fore.GREEN + '[{}] '.format(timestamp) + Style.RESET_ALL + '{}'.format(text) + Style.RESET_ALL)
+
+# -----------------------------------------------------------------------------
+#  Script Argument parsing
+# -----------------------------------------------------------------------------
+
+# Argparse
+opt_debug = False
+opt_verbose = False
+opt_useTestFile = False
+opt_write = False
+opt_topdir = False
+opt_copyMarks = False
+opt_versions = False
+opt_similar = False
+opt_normalize = False
+opt_stripComments = False
+opt_fullDigests = False
+opt_zips = False
+opt_metadata = False
+opt_deps = False
+
+default_empty_fspec = ''
+default_digest_name = 'md5'
+default_similarity = 0.7
+default_buffer_size = 1024 * 1024
+default_checkpoint_interval = 60
+digestNames = ['md5', 'blake2b']
+
+# run settings, parseOptions() sets them from our command line
+from_filename = default_empty_fspec
+output_filename = default_empty_fspec
+root_dirspec = default_empty_fspec
+batch_filename = default_empty_fspec
+opt_jobs = os.cpu_count() or 1
+walk_jobs = 0
+digest_name = default_digest_name
+cache_filename = default_empty_fspec
+state_filename = default_empty_fspec
+similarity_min = default_similarity
+timings_filename = default_empty_fspec
+opt_stats = False
+profile_filename = default_empty_fspec
+opt_progress = False
+jsonl_filename = default_empty_fspec
+output_buffer_size = default_buffer_size
+output_flush_interval = 0
+sqlite_filename = default_empty_fspec
+ignore_filenames = []
+ignore_rule_texts = []
+spill_memory_mb = 0
+checkpoint_interval = default_checkpoint_interval
+opt_resume = False
+checkpoint_options = {}
+spill_dirspec = default_empty_fspec
+report_top_count = 0
+report_section_names = None
+uses_objectspec = default_empty_fspec
+opt_unresolved = False
+
+def parseOptions(argv=None):
+    global opt_verbose
+    global opt_debug
+    global from_filename
+    global output_filename
+    global root_dirspec
+    global batch_filename
+    global opt_jobs
+    global walk_jobs
+    global digest_name
+    global cache_filename
+    global opt_versions
+    global state_filename
+    global opt_similar
+    global similarity_min
+    global opt_stripComments
+    global opt_normalize
+    global opt_fullDigests
+    global opt_zips
+    global opt_metadata
+    global opt_deps
+    global uses_objectspec
+    global opt_unresolved
+    global timings_filename
+    global opt_stats
+    global profile_filename
+    global opt_progress
+    global jsonl_filename
+    global output_buffer_size
+    global output_flush_interval
+    global sqlite_filename
+    global ignore_filenames
+    global ignore_rule_texts
+    global spill_memory_mb
+    global checkpoint_interval
+    global opt_resume
+    global checkpoint_options
+    global spill_dirspec
+    global report_top_count
+    global report_section_names
+    global opt_write
+    global opt_topdir
+    global opt_copyMarks
+    # Argparse
+    import argparse
+    parser = argparse.ArgumentParser(description=project_name, epilog='For further details see: ' + project_url)
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    parser.add_argument("-d", "--debug", help="show debug output", action="store_true")
+    parser.add_argument("-o", "--outfile", help="specify output file name", default=default_empty_fspec)
+    parser.add_argument("-f", "--fromfile", help="specify input file name for marks to copy", default=default_empty_fspec)
+    parser.add_argument("-r", "--rootdir", help="specify starting root directory", default=default_empty_fspec)
+    parser.add_argument("-b", "--batch", help="specify manifest of 'root<TAB>marks-file<TAB>output-file' lines ('-' for stdin) to list in one run, -o then names the cross-root summary", default=default_empty_fspec)
+    parser.add_argument("-j", "--jobs", help="number of hashing threads (default: nbr of CPUs)", type=int, default=0)
+    parser.add_argument("-w", "--walk-jobs", help="list up to N folders at once ahead of the walk, for synced or network file systems (default: 0, one at a time)", type=int, default=0, metavar="N")
+    parser.add_argument("--digest", help="content digest to use (default: md5)", choices=digestNames, default=default_digest_name)
+    parser.add_argument("-c", "--cache", help="specify digest cache file (reused across runs)", default=default_empty_fspec)
+    parser.add_argument("-s", "--state", help="specify scan state file: reused to skip unchanged folders and write a delta report, then updated", default=default_empty_fspec)
+    parser.add_argument("--versions", help="list the folders holding each version of files appearing more than once", action="store_true")
+    parser.add_argument("--similar", help="also report near-duplicate spin files (reads each unique file once more)", action="store_true")
+    parser.add_argument("--similarity", help="lowest estimated similarity reported by --similar (default: {})".format(default_similarity), type=float, default=default_similarity)
+    parser.add_argument("--normalized", help="also digest content normalized for encoding, line endings and trailing blanks", action="store_true")
+    parser.add_argument("-m", "--metadata", help="also gather spin structure stats (lines, CON/VAR/OBJ/PUB/PRI/DAT sections, PASM ratio, Spin2-ness) in the same read as the digest", action="store_true")
+    parser.add_argument("--deps", help="also parse OBJ references, resolve them against the files in the same folder and export the dependency graph (with --sqlite)", action="store_true")
+    parser.add_argument("--uses", help="query the --sqlite export of a --deps run (no scan): list the top-level objects that depend on NAME, or on one version of it with NAME:DIGEST", default=default_empty_fspec, metavar="NAME[:DIGEST]")
+    parser.add_argument("--unresolved", help="query the --sqlite export of a --deps run (no scan): list the folders with unresolved OBJ references", action="store_true")
+    parser.add_argument("--strip-comments", help="with --normalized, also ignore spin comments (and blank lines)", action="store_true")
+    parser.add_argument("--max-memory", help="keep the inventory in an on-disk store and sort the report on disk, using about MB megabytes for them, whatever the tree size", type=int, default=0, metavar="MB")
+    parser.add_argument("--spill-dir", help="folder for the --max-memory store (default: the system temp folder)", default=default_empty_fspec)
+    parser.add_argument("--checkpoint-every", help="while walking, save a checkpoint next to the output every N seconds (default: {}, 0 for never); each rewrites all found so far, about 160 bytes and 10us per spin file (100k files: 16MB, 1s, under 2%% of a walk at 60s), so use a larger N for trees of millions of files (-v shows their size and time)".format(default_checkpoint_interval), type=float, default=default_checkpoint_interval, metavar="N")
+    parser.add_argument("--resume", help="continue an interrupted run (same options) from its last checkpoint", action="store_true")
+    parser.add_argument("--top", help="also report the N most duplicated files", type=int, default=0, metavar="N")
+    parser.add_argument("--sections", help="comma separated report sections to write, of: {} (default: all that apply)".format(', '.join(sectionName for sectionName, sectionLines, isEnabled in reportSections)), default=None)
+    parser.add_argument("--jsonl", help="also stream the inventory as JSON Lines (one record per listed file) to this file", default=default_empty_fspec)
+    parser.add_argument("--sqlite", help="also export the inventory as an indexed SQLite database to this file", default=default_empty_fspec)
+    parser.add_argument("--buffer-size", help="output buffer size in bytes (default: {})".format(default_buffer_size), type=int, default=default_buffer_size)
+    parser.add_argument("--flush-every", help="flush output at most every N seconds so progress is visible (default: 0, only at end)", type=float, default=0)
+    parser.add_argument("--exclude", help="skip files and folders matching this gitignore-style pattern (repeatable)", dest="ignore_rules", action="append", default=[], metavar="PATTERN")
+    parser.add_argument("--include", help="list what an earlier --exclude pattern skips, like a '!PATTERN' rule (repeatable)", dest="ignore_rules", action="append", type=lambda pattern: '!' + pattern, metavar="PATTERN")
+    parser.add_argument("--ignore-file", help="read gitignore-style exclude rules from this file (repeatable, applied before --exclude/--include)", action="append", default=[])
+    parser.add_argument("-z", "--zips", help="also list spin files inside .zip archives, as folders named 'archive.zip!'", action="store_true")
+    parser.add_argument("--stats", help="show wall time and counts for each phase (walk, hash, marks, report)", action="store_true")
+    parser.add_argument("--profile", help="write a cProfile (pstats) dump of the main thread to this file", default=default_empty_fspec)
+    parser.add_argument("--no-progress", help="don't show live progress on stderr (shown for long runs when stderr is a terminal)", action="store_true")
+    parser.add_argument("--timings", help="write per-phase wall times, counts and peak RSS as JSON to this file", default=default_empty_fspec)
+    parser.add_argument("--full-digests", help="digest every spin file, not just those that could be duplicates", action="store_true")
+    parse_args = parser.parse_args(argv)
+
+    opt_verbose = parse_args.verbose
+    opt_debug = parse_args.debug
+    from_filename = parse_args.fromfile
+    output_filename = parse_args.outfile
+    root_dirspec = parse_args.rootdir
+    batch_filename = parse_args.batch
+    opt_jobs = parse_args.jobs
+    walk_jobs = max(parse_args.walk_jobs, 0)
+    digest_name = parse_args.digest
+    cache_filename = parse_args.cache
+    opt_versions = parse_args.versions
+    state_filename = parse_args.state
+    opt_similar = parse_args.similar
+    similarity_min = parse_args.similarity
+    opt_stripComments = parse_args.strip_comments
+    opt_normalize = parse_args.normalized or opt_stripComments
+    opt_fullDigests = parse_args.full_digests
+    opt_zips = parse_args.zips
+    opt_metadata = parse_args.metadata
+    opt_deps = parse_args.deps
+    uses_objectspec = parse_args.uses
+    opt_unresolved = parse_args.unresolved
+    timings_filename = parse_args.timings
+    opt_stats = parse_args.stats
+    profile_filename = parse_args.profile
+    # verbose output already shows where we are
+    opt_progress = sys.stderr.isatty() and not parse_args.no_progress and not opt_verbose and not opt_debug
+    jsonl_filename = parse_args.jsonl
+    output_buffer_size = max(parse_args.buffer_size, 1)
+    output_flush_interval = parse_args.flush_every
+    sqlite_filename = parse_args.sqlite
+    ignore_filenames = parse_args.ignore_file
+    ignore_rule_texts = parse_args.ignore_rules
+    report_top_count = max(parse_args.top, 0)
+    spill_memory_mb = max(parse_args.max_memory, 0)
+    spill_dirspec = parse_args.spill_dir
+    checkpoint_interval = parse_args.checkpoint_every
+    opt_resume = parse_args.resume
+    # a checkpoint is only resumed by a run that would list the same way
+    checkpoint_options = {optionName: optionValue for optionName, optionValue in vars(parse_args).items()
+                          if optionName not in ('resume', 'checkpoint_every', 'verbose', 'debug', 'no_progress', 'stats', 'profile', 'timings', 'jobs', 'walk_jobs')}
+    if parse_args.sections is not None:
+        report_section_names = set(sectionName.strip() for sectionName in parse_args.sections.split(',') if len(sectionName.strip()) > 0)
+    if opt_jobs < 1:
+        opt_jobs = os.cpu_count() or 1
+    if len(output_filename) > 0:
+        opt_write = True
+    if len(root_dirspec) > 0:
+        opt_topdir = True
+    if len(from_filename) > 0:
+        opt_copyMarks = True
+
+    print_line(script_info, info=True)
+    if opt_verbose:
+        print_line('Verbose enabled', verbose=True)
+    if opt_debug:
+        print_line('Debug enabled', debug=True)
+    print_line('Hashing with [{}] using {} thread(s)'.format(digest_name, opt_jobs), verbose=True)
+
+    if len(uses_objectspec) > 0 or opt_unresolved:
+        # queries only read an earlier export
+        if len(sqlite_filename) == 0 or not os.path.exists(sqlite_filename):
+            print_line('ERROR: --uses and --unresolved query an existing --sqlite export, missing or not found [{}]'.format(sqlite_filename), error=True)
+            os._exit(1)
+        return
+
+    if not opt_write:
+        print_line('ERROR: need output filename, missing -o directive', error=True)
+        os._exit(1)
+
+    if not opt_topdir and len(batch_filename) == 0:
+        print_line('ERROR: need top folder name to list, missing -r directive', error=True)
+        os._exit(1)
+
+    if len(batch_filename) > 0 and (opt_topdir or opt_copyMarks or len(state_filename) > 0 or len(jsonl_filename) > 0 or len(sqlite_filename) > 0):
+        print_line('ERROR: --batch takes roots and marks from its manifest, and can\'t be used with -r, -f, -s, --jsonl or --sqlite', error=True)
+        os._exit(1)
+
+    if spill_memory_mb > 0 and (len(batch_filename) > 0 or len(state_filename) > 0 or opt_similar or opt_normalize or opt_metadata or opt_deps):
+        # these keep something per file or per digest in memory
+        print_line('ERROR: --max-memory can\'t be used with --batch, -s, --similar, --normalized, --metadata or --deps', error=True)
+        os._exit(1)
+
+    if report_section_names is not None:
+        unknownNames = report_section_names.difference(sectionName for sectionName, sectionLines, isEnabled in reportSections)
+        if len(unknownNames) > 0:
+            print_line('ERROR: unknown report section(s) [{}] for --sections'.format(', '.join(sorted(unknownNames))), error=True)
+            os._exit(1)
+
+    if len(ignore_filenames) + len(ignore_rule_texts) > 0 and not compileIgnoreRules():
+        os._exit(1)
+
+# -----------------------------------------------------------------------------
+#  Output files
+# -----------------------------------------------------------------------------
+#  Output goes to a temp file next to the target, written through a large
+#  buffer, and is renamed over the target only once complete: a crash never
+#  leaves a truncated .taskpaper behind for the next -f marks merge to read
+#  (and -f may safely name the file we're replacing).
+#  A checkpoint keeps the temp file (should we be stopped) and notes how
+#  far it got, resumeFrom=(temp file, offset) then carries on from there.
+class AtomicOutputFile:
+    def __init__(self, fileSpec, bufferSize=default_buffer_size, flushInterval=0, encoding=None, errors=None, newline=None, resumeFrom=None, binary=False):
+        self.fileSpec = fileSpec
+        self.flushInterval = flushInterval
+        self.nextFlushTime = time() + flushInterval
+        self.keepPartial = False
+        if resumeFrom is not None:
+            self.tempFileSpec, offset = resumeFrom
+            os.truncate(self.tempFileSpec, offset)
+            self.file_fp = open(self.tempFileSpec, 'a', buffering=bufferSize, encoding=encoding, errors=errors, newline=newline)
+        else:
+            import tempfile
+            fileDir = os.path.dirname(os.path.abspath(fileSpec))
+            fd, self.tempFileSpec = tempfile.mkstemp(dir=fileDir, prefix='.{}.'.format(os.path.basename(fileSpec)), suffix='.tmp')
+            self.file_fp = os.fdopen(fd, 'wb' if binary else 'w', buffering=bufferSize, encoding=encoding, errors=errors, newline=newline)
+        atexit.register(self.discard)
+
+    def checkpoint(self):
+        # -> (temp file, bytes written so far)
+        self.file_fp.flush()
+        self.keepPartial = True
+        return (self.tempFileSpec, self.file_fp.buffer.tell())
+
+    def write(self, text):
+        self.file_fp.write(text)
+        if self.flushInterval > 0 and time() >= self.nextFlushTime:
+            self.file_fp.flush()
+            self.nextFlushTime = time() + self.flushInterval
+
+    def close(self):
+        # commit: flush, make it durable, give it normal permissions, rename
+        if self.file_fp is None:
+            return
+        self.file_fp.flush()
+        os.fsync(self.file_fp.fileno())
+        self.file_fp.close()
+        self.file_fp = None
+        currentUmask = os.umask(0)
+        os.umask(currentUmask)
+        os.chmod(self.tempFileSpec, 0o666 & ~currentUmask)
+        os.replace(self.tempFileSpec, self.fileSpec)
+        atexit.unregister(self.discard)
+
+    def discard(self):
+        if self.file_fp is not None:
+            self.file_fp.close()
+            self.file_fp = None
+            if not self.keepPartial:
+                os.remove(self.tempFileSpec)
+
+class NullOutputFile:
+    # scan() without an output file: the listing goes nowhere
+    def write(self, text):
+        pass
+
+    def checkpoint(self):
+        return None
+
+    def close(self):
+        pass
+
+    def discard(self):
+        pass
+
+# -----------------------------------------------------------------------------
+#  Phase timing, counters and progress
+# -----------------------------------------------------------------------------
+#  Wall time is charged to one phase at a time: switching to a phase pauses
+#  the one we were in, so the phase times add up to the run time instead of
+#  overlapping (hashing done during the walk isn't also counted as walk).
+class PhaseClock:
+    __slots__ = ('secondsByPhase', 'phaseName', 'startTime', 'runStartTime')
+
+    def __init__(self):
+        self.secondsByPhase = {}
+        self.phaseName = None
+        self.startTime = perf_counter()
+        self.runStartTime = self.startTime
+
+    def switch(self, phaseName):
+        # returns the phase we were in so the caller can switch back to it
+        now = perf_counter()
+        if self.phaseName is not None:
+            self.secondsByPhase[self.phaseName] = self.secondsByPhase.get(self.phaseName, 0.0) + now - self.startTime
+        priorPhase = self.phaseName
+        self.phaseName = phaseName
+        self.startTime = now
+        return priorPhase
+
+    def runSeconds(self):
+        return perf_counter() - self.runStartTime
+
+phaseClock = PhaseClock()
+runCounts = {'roots': 0, 'dirs': 0, 'pruned': 0, 'spinFiles': 0, 'filesHashed': 0, 'partialDigests': 0, 'bytesSeen': 0, 'bytesRead': 0,
+             'cacheHits': 0, 'cacheMisses': 0, 'marksLookups': 0, 'marksFound': 0, 'unreadableArchives': 0}
+statsDetailByPhase = {
+    'walk': '{dirs} folders, {spinFiles} spin files ({bytesSeen} bytes), {pruned} pruned',
+    'hash': '{filesHashed} files digested, {partialDigests} partial digests, {bytesRead} bytes read, {cacheHits} cache hits, {cacheMisses} misses',
+    'marks': '{marksLookups} lookups, {marksFound} with marks',
+    'report': '{roots} listing(s) written',
+}
+
+def printStats():
+    phaseClock.switch(None)
+    runSeconds = phaseClock.runSeconds()
+    for phaseName, seconds in phaseClock.secondsByPhase.items():
+        print_line('Stats: {:<7}{:9.3f}s {:5.1f}%  {}'.format(phaseName, seconds, (100.0 * seconds / runSeconds) if runSeconds > 0 else 0.0, statsDetailByPhase.get(phaseName, '').format(**runCounts)), info=True)
+    print_line('Stats: {:<7}{:9.3f}s  {:.0f} spin files/sec'.format('total', runSeconds, runCounts['spinFiles'] / runSeconds if runSeconds > 0 else 0.0), info=True)
+
+# a status line on stderr, redrawn at most every progressEvery seconds, and
+#  only once the run has taken progressAfter seconds (short runs stay quiet)
+progressEvery = 0.25
+progressAfter = 2.0
+
+class ProgressMeter:
+    __slots__ = ('label', 'total', 'done', 'unit', 'startTime', 'shownTime', 'isShowing')
+
+    def __init__(self):
+        self.isShowing = False
+        self.start('', None, '')
+
+    def start(self, label, total, unit):
+        # total may be None (unknown), we then show a rate but no ETA
+        self.finish()
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.unit = unit
+        self.startTime = perf_counter()
+        self.shownTime = self.startTime
+
+    def advance(self, count=1, detail=''):
+        self.done += count
+        if not opt_progress:
+            return
+        now = perf_counter()
+        if now - self.shownTime < progressEvery or now - phaseClock.runStartTime < progressAfter:
+            return
+        self.shownTime = now
+        elapsed = now - self.startTime
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        status = '{}: {} {}'.format(self.label, self.done, self.unit)
+        if self.total is not None and self.total > self.done and rate > 0:
+            etaSeconds = int((self.total - self.done) / rate)
+            status = '{}: {}/{} {} ({:.0f}%)'.format(self.label, self.done, self.total, self.unit, 100.0 * self.done / self.total)
+            status += ', {:.0f}/s, ETA {}:{:02d}'.format(rate, etaSeconds // 60, etaSeconds % 60)
+        else:
+            status += ', {:.0f}/s'.format(rate)
+        if len(detail) > 0:
+            status += ', {}'.format(detail)
+        sys.stderr.write('\r{}\x1b[K'.format(status))
+        sys.stderr.flush()
+        self.isShowing = True
+
+    def finish(self):
+        if self.isShowing:
+            sys.stderr.write('\r\x1b[K')
+            sys.stderr.flush()
+            self.isShowing = False
+
+progress = ProgressMeter()
+
+def peakRssKb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return maxRss // 1024 if sys.platform == 'darwin' else maxRss
+
+def writeTimings(timingsFileSpec):
+    import json
+    phaseClock.switch(None)
+    timings = {
+        'script': script_info,
+        'digest': digest_name,
+        'jobs': opt_jobs,
+        'phases': {phaseName: round(seconds, 6) for phaseName, seconds in phaseClock.secondsByPhase.items()},
+        'total': round(phaseClock.runSeconds(), 6),
+        'counts': runCounts,
+        'peakRssKb': peakRssKb(),
+    }
+    timings_fp = AtomicOutputFile(timingsFileSpec, output_buffer_size)
+    timings_fp.write(json.dumps(timings, indent=1))
+    timings_fp.write('\n')
+    timings_fp.close()
+
+# -----------------------------------------------------------------------------
+#  Ignore rules
+# -----------------------------------------------------------------------------
+#  gitignore-style rules, from --ignore-file files then --exclude/--include,
+#  compiled once.  The walker checks each name straight from its folder
+#  listing, so an excluded file is never opened and an excluded folder
+#  never listed.  As in .gitignore:
+#   - '#' lines are comments, a leading '!' re-includes what an earlier
+#     rule excluded (the last rule matching a name wins),
+#   - a trailing '/' only matches folders,
+#   - a pattern with a '/' is anchored to the root, one without matches
+#     the name at any depth,
+#   - '*' and '?' don't cross '/', '**' does, [abc] is a character class.
+#  Paths are root-relative with '/', folders in a .zip are 'name.zip!/...'.
+#  Matching ignores case, like git on macOS where these trees live.
+ignoreRules = None
+prunedEntryCount = 0
+
+class IgnoreRules:
+    # rules: [(negated, compiled pattern), ...] in file order
+    __slots__ = ('rules', 'anyRulePattern', 'haveNegations')
+
+    def __init__(self, ruleTexts):
+        self.rules = []
+        for ruleText in ruleTexts:
+            negated, rulePattern = self.patternOf(ruleText)
+            if rulePattern is not None:
+                self.rules.append((negated, rulePattern))
+        self.haveNegations = any(negated for negated, rulePattern in self.rules)
+        # one search decides the common case: no rule matches at all
+        self.anyRulePattern = re.compile('|'.join('(?:{})'.format(rulePattern) for negated, rulePattern in self.rules) or '(?!)', re.I)
+        self.rules = [(negated, re.compile(rulePattern, re.I)) for negated, rulePattern in self.rules]
+
+    @staticmethod
+    def patternOf(ruleText):
+        # -> (negated, regex source), regex source is None for no rule
+        ruleText = ruleText.rstrip('\n\r')
+        if ruleText.startswith('#') or len(ruleText.strip()) == 0:
+            return (False, None)
+        ruleText = ruleText.rstrip(' \t')
+        negated = ruleText.startswith('!')
+        if negated or ruleText.startswith('\\!') or ruleText.startswith('\\#'):
+            ruleText = ruleText[1:]
+        foldersOnly = ruleText.endswith('/')
+        ruleText = ruleText.rstrip('/')
+        anchored = '/' in ruleText
+        ruleText = ruleText.lstrip('/')
+        if len(ruleText) == 0:
+            return (False, None)
+        regexParts = ['^' if anchored else '^(?:.*/)?']
+        charNbr = 0
+        while charNbr < len(ruleText):
+            ruleChar = ruleText[charNbr]
+            if ruleText.startswith('**/', charNbr) and (charNbr == 0 or ruleText[charNbr-1] == '/'):
+                regexParts.append('(?:.*/)?')
+                charNbr += 3
+                continue
+            if ruleText.startswith('**', charNbr):
+                regexParts.append('.*')
+                charNbr += 2
+                continue
+            if ruleChar == '*':
+                regexParts.append('[^/]*')
+            elif ruleChar == '?':
+                regexParts.append('[^/]')
+            elif ruleChar == '[' and ']' in ruleText[charNbr+2:]:
+                classEnd = ruleText.index(']', charNbr+2)
+                classText = ruleText[charNbr+1:classEnd]
+                if classText.startswith('!'):
+                    classText = '^' + classText[1:]
+                regexParts.append('[{}]'.format(classText.replace('\\', '\\\\')))
+                charNbr = classEnd
+            elif ruleChar == '\\' and charNbr + 1 < len(ruleText):
+                charNbr += 1
+                regexParts.append(re.escape(ruleText[charNbr]))
+            else:
+                regexParts.append(re.escape(ruleChar))
+            charNbr += 1
+        # folders are matched as 'path/', files as 'path'
+        regexParts.append('/$' if foldersOnly else '/?$')
+        return (negated, ''.join(regexParts))
+
+    def isIgnored(self, relPath, isFolder):
+        if isFolder:
+            relPath += '/'
+        if self.anyRulePattern.search(relPath) is None:
+            return False
+        if not self.haveNegations:
+            return True
+        for negated, rulePattern in reversed(self.rules):
+            if rulePattern.search(relPath) is not None:
+                return not negated
+        return False
+
+def compileIgnoreRules():
+    global ignoreRules
+    ruleTexts = []
+    for ignoreFileSpec in ignore_filenames:
+        try:
+            with open(ignoreFileSpec, 'r', encoding='utf-8') as ignore_fp:
+                ruleTexts.extend(ignore_fp.readlines())
+        except (OSError, UnicodeDecodeError) as ex:
+            print_line('ERROR: Unable to read ignore file [{}]: {}'.format(ignoreFileSpec, ex), error=True)
+            return False
+    ruleTexts.extend(ignore_rule_texts)
+    try:
+        ignoreRules = IgnoreRules(ruleTexts)
+    except re.error as ex:
+        print_line('ERROR: Bad ignore rule: {}'.format(ex), error=True)
+        return False
+    print_line('Ignore rules: {}'.format(len(ignoreRules.rules)), verbose=True)
+    return True
+
+def ignoreRuleTexts():
+    # the compiled rules a scan state was made with: other rules, other listings
+    if ignoreRules is None:
+        return []
+    return ['{}{}'.format('!' if negated else '', rulePattern.pattern) for negated, rulePattern in ignoreRules.rules]
+
+def isPruned(relDir, name, isFolder):
+    # callers count what's pruned, folders may be listed on walk threads
+    if ignoreRules.isIgnored(name if relDir == '.' else '{}/{}'.format(relDir, name), isFolder):
+        print_line('Pruned [{}/{}]'.format(relDir, name), debug=True)
+        return True
+    return False
+
+write_fp = None
+
+def writeFinding(message):
+    write_fp.write('{}\n'.format(message))
+
+class RootUnreadableError(OSError):
+    # the root can't be listed: main() exits 1, scan() callers get it raised
+    pass
+
+def scanFolder(dirSpec):
+    # one scandir() pass; DirEntry type info comes from the directory listing
+    #  itself so we don't pay an extra stat() per name to classify it
+    folderSpecList = []
+    fileSpecList = []
+    spinFileEntries = []
+    nbrPruned = 0
+    relDir = relativeToRoot(dirSpec) if ignoreRules is not None else None
+    try:
+        with os.scandir(dirSpec) as folder_content:
+            for entry in folder_content:
+                filename = entry.name
+                if entry.is_dir():
+                    # prune dot-dirs here, they are never descended into
+                    if filename.startswith('.'):
+                        continue
+                    if relDir is not None and isPruned(relDir, filename, True):
+                        nbrPruned += 1
+                        continue
+                    folderSpecList.append(filename)
+                elif entry.is_file():
+                    if relDir is not None and isPruned(relDir, filename, False):
+                        nbrPruned += 1
+                        continue
+                    if opt_zips and filename.lower().endswith('.zip') and not filename.startswith('.'):
+                        # walked as a folder, see contentsOfZipFolder()
+                        folderSpecList.append(filename + '!')
+                        continue
+                    if isSpinFile(filename):
+                        spinFileEntries.append(entry)
+                    fileSpecList.append(filename)
+                else:
+                    print_line('WARNING: Skipping unknown name=[{}/{}]'.format(dirSpec, entry.path), warning=True)
+    except OSError as ex:
+        if dirSpec == root_dirspec:
+            raise RootUnreadableError('Unable to list root folder=[{}]: {}'.format(dirSpec, ex)) from ex
+        print_line('WARNING: Unable to list folder=[{}]: {}'.format(dirSpec, ex), warning=True)
+    return (fileSpecList, folderSpecList, spinFileEntries, nbrPruned)
+
+def contentsOfDir(dirSpec):
+    global prunedEntryCount
+    listingFuture = folderPrefetcher.take(dirSpec) if folderPrefetcher is not None else None
+    # a folder unchanged since our prior scan is not re-listed
+    priorContents = priorContentsOfDir(dirSpec)
+    if priorContents is not None:
+        return priorContents
+    digestByFilename = {}
+    zipSpec = splitZipSpec(dirSpec)
+    if zipSpec is not None:
+        fileSpecList, folderSpecList, spinFileEntries, nbrPruned = contentsOfZipFolder(dirSpec, zipSpec[0], zipSpec[1])
+    elif listingFuture is not None:
+        fileSpecList, folderSpecList, spinFileEntries, nbrPruned = listingFuture.result()
+    else:
+        fileSpecList, folderSpecList, spinFileEntries, nbrPruned = scanFolder(dirSpec)
+    prunedEntryCount += nbrPruned
+
+    if not opt_fullDigests:
+        # staged: digests are worked out once the whole tree is known
+        for entry in spinFileEntries:
+            digestByFilename[entry.name] = stageFile(entry)
+        return (fileSpecList, folderSpecList, digestByFilename)
+
+    # hash this folder's spin files on the pool, but record them in listing order
+    #  so our digest ordering (and thus our report) doesn't depend on thread timing
+    countBytesSeen(spinFileEntries)
+    for entry, md5sum in zip(spinFileEntries, cachedDigestsOfFiles(spinFileEntries)):
+        inventory.recordFileDigest(md5sum, entry.name, entry.path)
+        digestByFilename[entry.name] = md5sum
+
+    if opt_saveState:
+        rememberDirState(dirSpec, fileSpecList, folderSpecList, spinFileEntries, digestByFilename, nbrPruned=nbrPruned)
+
+    print_line('files=[{}]'.format(fileSpecList), debug=True)
+    print_line('folders=[{}]'.format(folderSpecList), debug=True)
+    return (fileSpecList, folderSpecList, digestByFilename)
+
+# -----------------------------------------------------------------------------
+#  Listing folders ahead of the walk
+# -----------------------------------------------------------------------------
+#  On synced or network file systems each listdir/stat is a round trip, so
+#  with --walk-jobs the folders the walk will visit next (the top of its
+#  stack) are listed, and their spin files stat()ed, on a small thread
+#  pool while it works on the current one.  The walk itself still takes
+#  folders one at a time in its own order, so the listing is unchanged.
+#  At most walkAheadPerJob folders per job are listed ahead; folders in a
+#  .zip or expected to be reused from the scan state are left to the walk.
+walkAheadPerJob = 4
+folderPrefetcher = None
+
+def prefetchFolder(dirSpec):
+    listing = scanFolder(dirSpec)
+    # a DirEntry keeps its stat(), so sizes are in hand when the walk gets here
+    for entry in listing[2]:
+        try:
+            entry.stat()
+        except OSError:
+            pass
+    return listing
+
+class FolderPrefetcher:
+    __slots__ = ('pool', 'futureByDirSpec', 'maxAhead')
+
+    def __init__(self, nbrJobs):
+        from concurrent.futures import ThreadPoolExecutor
+        self.pool = ThreadPoolExecutor(max_workers=nbrJobs, thread_name_prefix='walk')
+        self.futureByDirSpec = {}
+        self.maxAhead = nbrJobs * walkAheadPerJob
+
+    def prefetch(self, folderStack):
+        # the walk pops from the end, so look there, and no deeper than
+        #  we'd list ahead anyway
+        for dirSpec, dirDepth, dirParentName in reversed(folderStack[-self.maxAhead:]):
+            if len(self.futureByDirSpec) >= self.maxAhead:
+                break
+            if dirSpec in self.futureByDirSpec or splitZipSpec(dirSpec) is not None or relativeToRoot(dirSpec) in priorDirStateByRelDir:
+                continue
+            self.futureByDirSpec[dirSpec] = self.pool.submit(prefetchFolder, dirSpec)
+
+    def take(self, dirSpec):
+        return self.futureByDirSpec.pop(dirSpec, None)
+
+    def close(self):
+        for listingFuture in self.futureByDirSpec.values():
+            listingFuture.cancel()
+        self.pool.shutdown()
+
+# -----------------------------------------------------------------------------
+#  Zip archives as folders
+# -----------------------------------------------------------------------------
+#  With --zips an 'archive.zip' is walked as a folder named 'archive.zip!', so
+#  its spin files are listed under 'archive.zip!/path'.  Listing an archive
+#  only reads its central directory; members are streamed straight out of
+#  the archive by the hashing pool, nothing is extracted.  A member changes
+#  only when its archive does, so members carry the archive's mtime/inode.
+#  Each thread keeps at most zipArchivesOpenPerThread archives open (least
+#  recently used are closed first) so a folder of many archives can't run
+#  us out of file handles.  An archive we can't read fails the run.
+zipFolderSuffix = '.zip!'
+zipIndexByArchive = {}
+zipArchivesByKey = {}
+zipArchivesLock = threading.Lock()
+zipArchivesOpenPerThread = 4
+# zipfile.BadZipFile joins these once zipfile is loaded by zipArchiveFor()
+zipReadErrors = (OSError, EOFError, zlib.error, NotImplementedError)
+
+class ZipIndex:
+    __slots__ = ('archiveStat', 'memberInfos', 'foldersByInnerDir')
+
+    def __init__(self, archiveStat):
+        self.archiveStat = archiveStat
+        self.memberInfos = {}
+        # inner dir ('' is the archive itself) -> ([file names], [folder names])
+        self.foldersByInnerDir = {'': ([], [])}
+
+class ZipMemberStat:
+    # just enough of os.stat_result for our caching/state code
+    __slots__ = ('st_size', 'st_mtime_ns', 'st_ino', 'st_nlink')
+
+    def __init__(self, size, archiveStat):
+        self.st_size = size
+        self.st_mtime_ns = archiveStat.st_mtime_ns
+        self.st_ino = archiveStat.st_ino
+        self.st_nlink = 1
+
+def splitZipSpec(fileSpec):
+    # '/a/b.zip!/c/d.spin2' -> ('/a/b.zip', 'c/d.spin2'), None when not in an archive
+    if not opt_zips:
+        return None
+    lowerSpec = fileSpec.lower()
+    markerIndex = lowerSpec.find(zipFolderSuffix + os.sep)
+    if markerIndex < 0:
+        if not lowerSpec.endswith(zipFolderSuffix):
+            return None
+        markerIndex = len(fileSpec) - len(zipFolderSuffix)
+    archiveSpec = fileSpec[:markerIndex + len(zipFolderSuffix) - 1]
+    innerSpec = fileSpec[markerIndex + len(zipFolderSuffix) + 1:]
+    return (archiveSpec, innerSpec.replace(os.sep, '/'))
+
+def zipArchiveFor(archiveSpec):
+    # one open ZipFile per thread and archive, so members stream in parallel;
+    #  zipArchivesByKey is kept in least to most recently used order and a
+    #  thread only ever closes its own archives (a member being streamed
+    #  keeps its archive's file open until it is done with it)
+    global zipReadErrors
+    import zipfile
+    if zipfile.BadZipFile not in zipReadErrors:
+        zipReadErrors += (zipfile.BadZipFile,)
+    threadId = threading.get_ident()
+    archiveKey = (threadId, archiveSpec)
+    with zipArchivesLock:
+        zipArchive = zipArchivesByKey.pop(archiveKey, None)
+        if zipArchive is not None:
+            zipArchivesByKey[archiveKey] = zipArchive
+            return zipArchive
+        threadKeys = [zipKey for zipKey in zipArchivesByKey if zipKey[0] == threadId]
+        staleArchives = [zipArchivesByKey.pop(zipKey) for zipKey in threadKeys[:max(0, len(threadKeys) - zipArchivesOpenPerThread + 1)]]
+    for staleArchive in staleArchives:
+        staleArchive.close()
+    zipArchive = zipfile.ZipFile(archiveSpec)
+    with zipArchivesLock:
+        zipArchivesByKey[archiveKey] = zipArchive
+    return zipArchive
+
+def closeZipArchives():
+    with zipArchivesLock:
+        for zipArchive in zipArchivesByKey.values():
+            zipArchive.close()
+        zipArchivesByKey.clear()
+    zipIndexByArchive.clear()
+
+def zipIndexOf(archiveSpec):
+    zipIndex = zipIndexByArchive.get(archiveSpec)
+    if zipIndex is not None:
+        return zipIndex
+    zipIndex = ZipIndex(os.stat(archiveSpec))
+    try:
+        zipInfos = zipArchiveFor(archiveSpec).infolist()
+    except zipReadErrors as ex:
+        print_line('ERROR: Unable to list archive=[{}]: {}'.format(archiveSpec, ex), error=True)
+        runCounts['unreadableArchives'] += 1
+        zipInfos = []
+    for zipInfo in zipInfos:
+        nameParts = [namePart for namePart in zipInfo.filename.split('/') if namePart not in ('', '.')]
+        # skip folders, unsafe names and the resource forks macOS zips carry
+        if zipInfo.is_dir() or len(nameParts) == 0 or '..' in nameParts or nameParts[0] == '__MACOSX':
+            continue
+        innerSpec = '/'.join(nameParts)
+        if innerSpec in zipIndex.memberInfos:
+            continue
+        if zipInfo.flag_bits & 0x1:
+            print_line('WARNING: Skipping encrypted name=[{}!/{}]'.format(archiveSpec, innerSpec), warning=True)
+            continue
+        innerDir = ''
+        for namePart in nameParts[:-1]:
+            childDir = namePart if len(innerDir) == 0 else '{}/{}'.format(innerDir, namePart)
+            if childDir not in zipIndex.foldersByInnerDir:
+                zipIndex.foldersByInnerDir[innerDir][1].append(namePart)
+                zipIndex.foldersByInnerDir[childDir] = ([], [])
+            innerDir = childDir
+        zipIndex.foldersByInnerDir[innerDir][0].append(nameParts[-1])
+        zipIndex.memberInfos[innerSpec] = zipInfo
+    if spill_memory_mb > 0:
+        # the walk is done with the last archive once it reaches the next
+        zipIndexByArchive.clear()
+    zipIndexByArchive[archiveSpec] = zipIndex
+    return zipIndex
+
+def contentsOfZipFolder(dirSpec, archiveSpec, innerDir):
+    try:
+        zipIndex = zipIndexOf(archiveSpec)
+    except OSError as ex:
+        print_line('ERROR: Unable to list archive=[{}]: {}'.format(archiveSpec, ex), error=True)
+        runCounts['unreadableArchives'] += 1
+        return ([], [], [], 0)
+    fileNames, folderNames = zipIndex.foldersByInnerDir.get(innerDir, ([], []))
+    nbrPruned = 0
+    if ignoreRules is not None:
+        relDir = relativeToRoot(dirSpec)
+        nbrNames = len(fileNames) + len(folderNames)
+        fileNames = [filename for filename in fileNames if not isPruned(relDir, filename, False)]
+        folderNames = [folderName for folderName in folderNames if not isPruned(relDir, folderName, True)]
+        nbrPruned = nbrNames - len(fileNames) - len(folderNames)
+    spinFileEntries = []
+    for filename in fileNames:
+        if isSpinFile(filename):
+            zipInfo = zipIndex.memberInfos[filename if len(innerDir) == 0 else '{}/{}'.format(innerDir, filename)]
+            spinFileEntries.append(PriorFileEntry(filename, os.path.join(dirSpec, filename), ZipMemberStat(zipInfo.file_size, zipIndex.archiveStat)))
+    folderSpecList = [folderName for folderName in folderNames if not folderName.startswith('.')]
+    return (list(fileNames), folderSpecList, spinFileEntries, nbrPruned)
+
+def statOfSpec(fileSpec):
+    # os.stat() that also sees into archives: an archive's folders carry the
+    #  stat of the archive itself
+    zipSpec = splitZipSpec(fileSpec)
+    if zipSpec is None:
+        return os.stat(fileSpec)
+    archiveSpec, innerSpec = zipSpec
+    zipIndex = zipIndexOf(archiveSpec)
+    if innerSpec in zipIndex.foldersByInnerDir:
+        return zipIndex.archiveStat
+    zipInfo = zipIndex.memberInfos.get(innerSpec)
+    if zipInfo is None:
+        raise FileNotFoundError('no member [{}] in [{}]'.format(innerSpec, archiveSpec))
+    return ZipMemberStat(zipInfo.file_size, zipIndex.archiveStat)
+
+def openSpinFile(fileSpec):
+    # binary, unbuffered file object for a spin file on disk or in an archive
+    zipSpec = splitZipSpec(fileSpec)
+    if zipSpec is None:
+        return open(fileSpec, 'rb', buffering=0)
+    archiveSpec, innerSpec = zipSpec
+    zipIndex = zipIndexByArchive.get(archiveSpec)
+    zipInfo = zipIndex.memberInfos.get(innerSpec) if zipIndex is not None else None
+    return zipArchiveFor(archiveSpec).open(zipInfo.filename if zipInfo is not None else innerSpec)
+
+# -----------------------------------------------------------------------------
+#  Hashing engine
+# -----------------------------------------------------------------------------
+#  files are read in large chunks into a reused buffer and fed to hashlib,
+#  which releases the GIL while digesting so a thread pool scales well here.
+hashChunkSize = 1024 * 1024
+hashPool = None
+hashThreadState = threading.local()
+
+def newHasher():
+    import hashlib
+    if digest_name == 'blake2b':
+        # 16-byte digest so our listing keeps the same 32-hex-digit width as md5
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(digest_name)
+
+def digestOfFile(fileSpec):
+    hasher = newHasher()
+    normalizer = SpinNormalizer(opt_stripComments) if opt_normalize else None
+    structureScanner = SpinStructureScanner() if opt_metadata or opt_deps else None
+    # one read buffer per thread, reused for every file that thread hashes
+    if not hasattr(hashThreadState, 'buffer'):
+        hashThreadState.buffer = bytearray(hashChunkSize)
+        hashThreadState.bufferView = memoryview(hashThreadState.buffer)
+    buffer = hashThreadState.buffer
+    bufferView = hashThreadState.bufferView
+    try:
+        with openSpinFile(fileSpec) as file_fp:
+            while True:
+                nbrRead = file_fp.readinto(buffer)
+                if not nbrRead:
+                    break
+                hasher.update(bufferView[:nbrRead])
+                if normalizer is not None:
+                    normalizer.feed(bufferView[:nbrRead])
+                if structureScanner is not None:
+                    structureScanner.feed(bufferView[:nbrRead])
+    except zipReadErrors as ex:
+        print_line('digestOfFile!: failed to read [{}]: {}'.format(fileSpec, ex), warning=True)
+        return ''
+    digest = hasher.hexdigest()
+    if normalizer is not None:
+        normDigestByDigest[digest] = normalizer.finish()
+    if structureScanner is not None:
+        metadata = structureScanner.finish()
+        if opt_metadata:
+            metadataByDigest[digest] = metadata
+        if opt_deps:
+            objectRefsByDigest[digest] = tuple(structureScanner.objectRefs)
+    return digest
+
+def hashFiles(fileSpecList, progressLabel=None):
+    # mapOnPool() hands results back in submission order
+    runCounts['filesHashed'] += len(fileSpecList)
+    return mapOnPool(digestOfFile, fileSpecList, progressLabel)
+
+# -----------------------------------------------------------------------------
+#  Digest cache
+# -----------------------------------------------------------------------------
+#  digests are remembered by (path, size, mtime_ns, inode) so a rescan of an
+#  unchanged tree only needs to stat() each file.  So are the partial
+#  digests of staged dedupe, which decide which files need a full read.
+#  Entries for files under our root that we no longer see are evicted at
+#  the end of the run.
+cache_db = None
+cacheHitCount = 0
+cacheMissCount = 0
+cacheEvictCount = 0
+cachePendingRows = []
+partialPendingRows = []
+cacheSeenPaths = set()
+cacheCommitEvery = 1000
+
+def openDigestCache(cacheFileSpec):
+    global cache_db
+    import sqlite3
+    cache_db = sqlite3.connect(cacheFileSpec)
+    cache_db.execute('PRAGMA journal_mode=WAL')
+    cache_db.execute('PRAGMA synchronous=NORMAL')
+    cache_db.execute('CREATE TABLE IF NOT EXISTS digests ('
+                     'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, '
+                     'digest_name TEXT, digest TEXT)')
+    # normalized digests only depend on content, so they're keyed by raw digest
+    cache_db.execute('CREATE TABLE IF NOT EXISTS normdigests ('
+                     'digest TEXT, norm_mode TEXT, norm_digest TEXT, PRIMARY KEY (digest, norm_mode))')
+    for staleTable in ('spinmeta', 'spinmeta2'):
+        cache_db.execute('DROP TABLE IF EXISTS {}'.format(staleTable))
+    cache_db.execute('CREATE TABLE IF NOT EXISTS {} (digest TEXT PRIMARY KEY, {})'.format(metadataCacheTable,
+                     ', '.join('{} INTEGER'.format(fieldName) for fieldName in SpinMetadata.__slots__)))
+    cache_db.execute('DROP TABLE IF EXISTS objrefs')
+    cache_db.execute('CREATE TABLE IF NOT EXISTS {} (digest TEXT PRIMARY KEY, refs TEXT)'.format(objectRefsCacheTable))
+    cache_db.execute('CREATE TABLE IF NOT EXISTS partialdigests ('
+                     'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, '
+                     'digest_name TEXT, partial_digest TEXT)')
+    # folders seen by the last walk of each root, so progress can show an ETA
+    cache_db.execute('CREATE TABLE IF NOT EXISTS walks (root TEXT PRIMARY KEY, dirs INTEGER)')
+
+def priorWalkSizeOf(rootDirSpec):
+    if cache_db is None:
+        return None
+    row = cache_db.execute('SELECT dirs FROM walks WHERE root = ?', (os.path.abspath(rootDirSpec),)).fetchone()
+    return row[0] if row is not None else None
+
+def rememberWalkSize(rootDirSpec, nbrDirs):
+    if cache_db is not None:
+        cache_db.execute('INSERT OR REPLACE INTO walks VALUES (?, ?)', (os.path.abspath(rootDirSpec), nbrDirs))
+        cache_db.commit()
+
+def flushDigestCache():
+    global cachePendingRows
+    global partialPendingRows
+    global normPendingRows
+    global metadataPendingRows
+    global objectRefsPendingRows
+    if cache_db is not None and len(cachePendingRows) + len(partialPendingRows) + len(normPendingRows) + len(metadataPendingRows) + len(objectRefsPendingRows) > 0:
+        cache_db.executemany('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)', cachePendingRows)
+        cache_db.executemany('INSERT OR REPLACE INTO partialdigests VALUES (?, ?, ?, ?, ?, ?)', partialPendingRows)
+        cache_db.executemany('INSERT OR REPLACE INTO normdigests VALUES (?, ?, ?)', normPendingRows)
+        cache_db.executemany('INSERT OR REPLACE INTO {} VALUES (?{})'.format(metadataCacheTable, ', ?' * len(SpinMetadata.__slots__)), metadataPendingRows)
+        cache_db.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?)'.format(objectRefsCacheTable), objectRefsPendingRows)
+        cache_db.commit()
+        cachePendingRows = []
+        partialPendingRows = []
+        normPendingRows = []
+        metadataPendingRows = []
+        objectRefsPendingRows = []
+
+def evictDigestCache(topDirSpec):
+    global cacheEvictCount
+    if cache_db is None or cacheSeenPaths is None:
+        return
+    flushDigestCache()
+    # only evict below the root we just scanned, other roots share this cache
+    prefix = os.path.join(os.path.abspath(topDirSpec), '')
+    cursor = cache_db.execute('SELECT path FROM digests WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+    stalePaths = [(row[0],) for row in cursor if row[0] not in cacheSeenPaths]
+    if len(stalePaths) > 0:
+        cache_db.executemany('DELETE FROM digests WHERE path = ?', stalePaths)
+        cache_db.executemany('DELETE FROM partialdigests WHERE path = ?', stalePaths)
+        cache_db.commit()
+    cacheEvictCount += len(stalePaths)
+
+def closeDigestCache():
+    global cache_db
+    if cache_db is not None:
+        flushDigestCache()
+        cache_db.close()
+        cache_db = None
+
+def cachedDigestOf(entry):
+    # returns (digest or None, key to cache a new digest under, None when
+    #  it can't be stat()ed)
+    global cacheHitCount
+    path = os.path.abspath(entry.path)
+    try:
+        statInfo = entry.stat()
+    except OSError:
+        return (None, None)
+    if cacheSeenPaths is not None:
+        cacheSeenPaths.add(path)
+    cacheKey = (path, statInfo.st_size, statInfo.st_mtime_ns, statInfo.st_ino, digest_name)
+    row = cache_db.execute('SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ? AND digest_name = ?', cacheKey).fetchone()
+    if row is not None and haveDerivedDataFor(row[0]):
+        cacheHitCount += 1
+        return (row[0], cacheKey)
+    return (None, cacheKey)
+
+def cachedPartialDigestOf(cacheKey):
+    row = cache_db.execute('SELECT partial_digest FROM partialdigests WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ? AND digest_name = ?', cacheKey).fetchone()
+    return row[0] if row is not None else None
+
+def rememberPartialDigests(stagedFiles):
+    if cache_db is None:
+        return
+    for stagedFile in stagedFiles:
+        if stagedFile.cacheKey is not None and len(stagedFile.partialDigest) > 0:
+            partialPendingRows.append(stagedFile.cacheKey + (stagedFile.partialDigest,))
+    if len(partialPendingRows) >= cacheCommitEvery:
+        flushDigestCache()
+
+def rememberNewDigests(cacheKeys, digests):
+    global cacheMissCount
+    if cache_db is None:
+        return
+    cacheMissCount += len(cacheKeys)
+    for cacheKey, digest in zip(cacheKeys, digests):
+        if cacheKey is not None and len(digest) > 0:
+            cachePendingRows.append(cacheKey + (digest,))
+            if digest in normDigestByDigest:
+                normPendingRows.append((digest, normalizedMode(), normDigestByDigest[digest]))
+            if digest in metadataByDigest:
+                metadataPendingRows.append((digest,) + metadataByDigest[digest].asRow())
+            if digest in objectRefsByDigest:
+                objectRefsPendingRows.append((digest, encodeObjectRefs(objectRefsByDigest[digest])))
+    if len(cachePendingRows) >= cacheCommitEvery:
+        flushDigestCache()
+
+def cachedDigestsOfFiles(fileEntries):
+    priorPhase = phaseClock.switch('hash')
+    digests = cachedDigestsOfEntries(fileEntries)
+    phaseClock.switch(priorPhase)
+    return digests
+
+def cachedDigestsOfEntries(fileEntries):
+    fileSpecList = [entry.path for entry in fileEntries]
+    if cache_db is None:
+        countBytesRead(fileEntries)
+        return hashFiles(fileSpecList)
+    digests = [''] * len(fileSpecList)
+    missIndexes = []
+    missKeys = []
+    for index, entry in enumerate(fileEntries):
+        digest, cacheKey = cachedDigestOf(entry)
+        if digest is not None:
+            digests[index] = digest
+        else:
+            missIndexes.append(index)
+            missKeys.append(cacheKey)
+    if len(missIndexes) > 0:
+        missDigests = hashFiles([fileSpecList[index] for index in missIndexes])
+        countBytesRead([fileEntries[index] for index in missIndexes])
+        for index, digest in zip(missIndexes, missDigests):
+            digests[index] = digest
+        rememberNewDigests(missKeys, missDigests)
+    return digests
+
+# -----------------------------------------------------------------------------
+#  Staged dedupe (size -> partial digest -> full digest)
+# -----------------------------------------------------------------------------
+#  Most spin files have a size no other file has, so they can't be anyone's
+#  duplicate and don't need reading at all.  During the walk we only stat()
+#  files; once the tree is known, files sharing a size get the digest of
+#  their first stagePartialSize bytes, and only files still colliding after
+#  that get a full digest.  A file we never fully read is given a stand-in
+#  identity ('~size' or '~size:partial') which is unique by construction.
+#  With the digest cache, the partial digests we took are cached too: a
+#  size collision whose files all have a cached digest, full or partial,
+#  is then settled without reading any of them.
+stagePartialSize = 4096
+stagedFiles = []
+bytesSeenCount = 0
+bytesReadCount = 0
+
+class StagedFile:
+    __slots__ = ('name', 'path', 'size', 'digest', 'partialDigest', 'cacheKey', 'containerDir', 'exportRecord')
+
+    def __init__(self, name, path, size):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.digest = None
+        self.partialDigest = None
+        self.cacheKey = None
+        self.containerDir = None
+        self.exportRecord = None
+
+def statSize(entry):
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+def countBytesSeen(fileEntries):
+    global bytesSeenCount
+    bytesSeenCount += sum(statSize(entry) for entry in fileEntries)
+
+def countBytesRead(fileEntries):
+    global bytesReadCount
+    bytesReadCount += sum(statSize(entry) for entry in fileEntries)
+
+def stageFile(entry):
+    global bytesSeenCount
+    stagedFile = StagedFile(entry.name, entry.path, statSize(entry))
+    bytesSeenCount += stagedFile.size
+    if cache_db is not None:
+        stagedFile.digest, stagedFile.cacheKey = cachedDigestOf(entry)
+        if stagedFile.cacheKey is not None and stagedFile.size > stagePartialSize:
+            stagedFile.partialDigest = cachedPartialDigestOf(stagedFile.cacheKey)
+    stagedFiles.append(stagedFile)
+    return stagedFile
+
+def partialDigestOfFile(fileSpec):
+    hasher = newHasher()
+    try:
+        with openSpinFile(fileSpec) as file_fp:
+            hasher.update(file_fp.read(stagePartialSize))
+    except zipReadErrors as ex:
+        print_line('partialDigestOfFile!: failed to read [{}]: {}'.format(fileSpec, ex), warning=True)
+        return ''
+    return hasher.hexdigest()
+
+def mapOnPool(function, argList, progressLabel=None):
+    global hashPool
+    if opt_jobs < 2 or len(argList) < 2:
+        results = map(function, argList)
+    else:
+        if hashPool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            hashPool = ThreadPoolExecutor(max_workers=opt_jobs)
+        results = hashPool.map(function, argList)
+    if progressLabel is None:
+        return list(results)
+    progress.start(progressLabel, len(argList), 'files')
+    resultList = []
+    for result in results:
+        resultList.append(result)
+        progress.advance()
+    progress.finish()
+    return resultList
+
+def resolveStagedDigests():
+    global bytesReadCount
+    priorPhase = phaseClock.switch('hash')
+    stagedFilesBySize = {}
+    for stagedFile in stagedFiles:
+        stagedFilesBySize.setdefault(stagedFile.size, []).append(stagedFile)
+    # stage 1: size
+    needPartial = []
+    needFull = []
+    for size, sizeGroup in stagedFilesBySize.items():
+        unknownFiles = [stagedFile for stagedFile in sizeGroup if stagedFile.digest is None]
+        if len(sizeGroup) == 1:
+            if len(unknownFiles) == 1:
+                unknownFiles[0].digest = '~{}'.format(size)
+        elif size <= stagePartialSize:
+            # a partial read is the whole file
+            needFull.extend(unknownFiles)
+        elif all(stagedFile.partialDigest is not None for stagedFile in sizeGroup if stagedFile.digest is not None):
+            # files with a cached digest are told apart by their cached partial one
+            needPartial.extend(sizeGroup)
+        else:
+            # a cached digest shares this size, only a full read tells them apart
+            needFull.extend(unknownFiles)
+    # stage 2: partial digest, only within size collisions (cached ones aren't read again)
+    needRead = [stagedFile for stagedFile in needPartial if stagedFile.partialDigest is None]
+    runCounts['partialDigests'] += len(needRead)
+    for stagedFile, partialDigest in zip(needRead, mapOnPool(partialDigestOfFile, [stagedFile.path for stagedFile in needRead], 'Partial digests')):
+        bytesReadCount += stagePartialSize
+        stagedFile.partialDigest = partialDigest
+    rememberPartialDigests(needRead)
+    stagedFilesByPartial = {}
+    for stagedFile in needPartial:
+        stagedFilesByPartial.setdefault((stagedFile.size, stagedFile.partialDigest), []).append(stagedFile)
+    for (size, partialDigest), partialGroup in stagedFilesByPartial.items():
+        unknownFiles = [stagedFile for stagedFile in partialGroup if stagedFile.digest is None]
+        if len(partialGroup) == 1:
+            if len(unknownFiles) == 1:
+                unknownFiles[0].digest = '~{}:{}'.format(size, partialDigest)
+        else:
+            needFull.extend(unknownFiles)
+    # stage 3: full digest, only where partial digests collide too
+    fullDigests = hashFiles([stagedFile.path for stagedFile in needFull], 'Digests')
+    for stagedFile, digest in zip(needFull, fullDigests):
+        stagedFile.digest = digest
+        bytesReadCount += stagedFile.size
+    rememberNewDigests([stagedFile.cacheKey for stagedFile in needFull], fullDigests)
+    print_line('Staged: {} files, {} partial digests, {} full digests'.format(len(stagedFiles), len(needRead), len(needFull)), verbose=True)
+    # now record everything in walk order, exactly as a full scan would have
+    for stagedFile in stagedFiles:
+        inventory.recordFileDigest(stagedFile.digest, stagedFile.name, stagedFile.path)
+        if stagedFile.containerDir is not None:
+            inventory.recordFileFolder(stagedFile.name, stagedFile.digest, stagedFile.containerDir)
+        if stagedFile.exportRecord is not None:
+            exportFile(stagedFile.exportRecord, stagedFile.digest)
+    phaseClock.switch(priorPhase)
+
+# -----------------------------------------------------------------------------
+#  Inventory export (JSON Lines / SQLite)
+# -----------------------------------------------------------------------------
+#  Written in the same pass as the taskpaper: every file gets a real
+#  digest when exporting, so a listed file is exported as soon as it is
+#  listed and the rows of each folder are committed as it finishes.  A
+#  listed folder's dir_nbr is its label in the listing, which folders with
+#  the same label share; dir_id tells each folder we list apart.  Like the
+#  listing, the SQLite database is built in a temp file next to the target
+#  and only renamed over it once complete.
+opt_export = False
+jsonl_fp = None
+jsonlEncoder = None
+export_db = None
+exportTempFileSpec = ''
+exportKeepPartial = False
+exportDirId = 0
+exportFileId = 0
+exportedDigests = set()
+exportPendingRowsByTable = {}
+exportCommitEvery = 5000
+
+def openExports(checkpoint=None):
+    global jsonl_fp
+    global jsonlEncoder
+    global export_db
+    global exportTempFileSpec
+    global exportKeepPartial
+    global opt_export
+    if len(jsonl_filename) > 0:
+        import json
+        print_line('Exporting JSON Lines to [{}]'.format(jsonl_filename), info=True)
+        jsonlEncoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        jsonl_fp = AtomicOutputFile(jsonl_filename, output_buffer_size, output_flush_interval, encoding='utf-8',
+                                    resumeFrom=checkpoint['outputs']['jsonl'] if checkpoint is not None else None)
+    if len(sqlite_filename) > 0:
+        print_line('Exporting SQLite to [{}]'.format(sqlite_filename), info=True)
+        import sqlite3
+        atexit.register(discardExports)
+        if checkpoint is not None:
+            # drop what was added after the checkpoint, the walk adds it again
+            exportTempFileSpec = checkpoint['outputs']['sqlite'][0]
+            exportKeepPartial = True
+            export_db = sqlite3.connect(exportTempFileSpec)
+            checkpointFileId = checkpoint['globals']['exportFileId']
+            export_db.execute('DELETE FROM dirs WHERE dir_id > ?', (checkpoint['globals']['exportDirId'],))
+            for tableName in ('files', 'marks', 'objrefs'):
+                export_db.execute('DELETE FROM {} WHERE file_id > ?'.format(tableName), (checkpointFileId,))
+            for tableName in ('digests', 'spinmeta'):
+                export_db.execute('DELETE FROM {} WHERE digest NOT IN (SELECT digest FROM files)'.format(tableName))
+            export_db.commit()
+            opt_export = True
+            return
+        import tempfile
+        fileDir = os.path.dirname(os.path.abspath(sqlite_filename))
+        fd, exportTempFileSpec = tempfile.mkstemp(dir=fileDir, prefix='.{}.'.format(os.path.basename(sqlite_filename)), suffix='.tmp')
+        os.close(fd)
+        exportKeepPartial = False
+        export_db = sqlite3.connect(exportTempFileSpec)
+        # with checkpoints, a run stopped between them must leave the
+        #  export as of the last one, so keep a (write-ahead) journal
+        export_db.execute('PRAGMA journal_mode={}'.format('WAL' if len(checkpointFileSpec) > 0 else 'OFF'))
+        export_db.execute('PRAGMA synchronous=OFF')
+        export_db.execute('CREATE TABLE dirs (dir_id INTEGER PRIMARY KEY, dir_nbr INTEGER, depth INTEGER, name TEXT, path TEXT)')
+        export_db.execute('CREATE TABLE files (file_id INTEGER PRIMARY KEY, dir_id INTEGER, dir_nbr INTEGER, name TEXT, path TEXT, '
+                          'file_nbr INTEGER, seen INTEGER, digest TEXT)')
+        export_db.execute('CREATE TABLE digests (digest TEXT PRIMARY KEY, digest_name TEXT, norm_digest TEXT)')
+        export_db.execute('CREATE TABLE spinmeta (digest TEXT PRIMARY KEY, {}, pasm_ratio REAL, looks_spin2 INTEGER)'.format(
+                          ', '.join('{} INTEGER'.format(fieldName) for fieldName in SpinMetadata.__slots__)))
+        export_db.execute('CREATE TABLE marks (file_id INTEGER, seq INTEGER, kind TEXT, value TEXT)')
+        # one row per OBJ reference, ref_name is the sibling file it resolved
+        #  to (NULL when unresolved), so a file's users are the rows whose
+        #  (dir_id, ref_name) match its (dir_id, name)
+        export_db.execute('CREATE TABLE objrefs (file_id INTEGER, dir_id INTEGER, obj TEXT, ref TEXT, ref_name TEXT)')
+    opt_export = jsonl_fp is not None or export_db is not None
+
+def queueExportRow(tableName, row):
+    pendingRows = exportPendingRowsByTable.setdefault(tableName, [])
+    pendingRows.append(row)
+    if len(pendingRows) >= exportCommitEvery:
+        flushExportRows()
+
+def flushExportRows():
+    for tableName, pendingRows in exportPendingRowsByTable.items():
+        if len(pendingRows) > 0:
+            placeHolders = ', '.join('?' * len(pendingRows[0]))
+            export_db.executemany('INSERT OR IGNORE INTO {} VALUES ({})'.format(tableName, placeHolders), pendingRows)
+            pendingRows.clear()
+
+def exportDirectory(dirNbr, depth, containerDir, relDir):
+    # -> the folder's dir_id
+    global exportDirId
+    exportDirId += 1
+    if export_db is not None:
+        queueExportRow('dirs', (exportDirId, dirNbr, depth, containerDir, relDir))
+    return exportDirId
+
+def exportDirectoryDone():
+    # what a reader of the export sees grows a folder at a time
+    if export_db is not None:
+        flushExportRows()
+        export_db.commit()
+
+def exportFile(exportRecord, digest):
+    global exportFileId
+    exportRecord['digest'] = digest
+    if opt_metadata:
+        metadata = metadataByDigest.get(digest)
+        exportRecord['meta'] = metadata.asDict() if metadata is not None else None
+    if jsonl_fp is not None:
+        jsonl_fp.write('{}\n'.format(jsonlEncoder.encode(exportRecord)))
+    if export_db is not None:
+        exportFileId += 1
+        queueExportRow('files', (exportFileId, exportRecord['dirId'], exportRecord['dirNbr'], exportRecord['name'], exportRecord['path'],
+                                 exportRecord['fileNbr'], exportRecord['seen'], digest))
+        if exportedDigests is None or digest not in exportedDigests:
+            if exportedDigests is not None:
+                exportedDigests.add(digest)
+            queueExportRow('digests', (digest, digest_name, normDigestByDigest.get(digest)))
+            if digest in metadataByDigest:
+                metadata = metadataByDigest[digest]
+                queueExportRow('spinmeta', (digest,) + metadata.asRow() + (metadata.pasmRatio(), int(metadata.looksSpin2())))
+        markSeq = 0
+        if exportRecord['done'] is not None:
+            queueExportRow('marks', (exportFileId, markSeq, 'done', exportRecord['done']))
+            markSeq += 1
+        for noteTxt in exportRecord['notes']:
+            queueExportRow('marks', (exportFileId, markSeq, 'note', noteTxt))
+            markSeq += 1
+        for objectRef in exportRecord.get('objs', ()):
+            queueExportRow('objrefs', (exportFileId, exportRecord['dirId'], objectRef['obj'], objectRef['ref'], objectRef['file']))
+
+def closeExports():
+    global jsonl_fp
+    global export_db
+    if jsonl_fp is not None:
+        jsonl_fp.close()
+        jsonl_fp = None
+    if export_db is not None:
+        flushExportRows()
+        # indexes built once, after the bulk insert
+        export_db.execute('CREATE INDEX files_by_name ON files (name COLLATE NOCASE)')
+        export_db.execute('CREATE INDEX files_by_digest ON files (digest)')
+        export_db.execute('CREATE INDEX files_by_dir ON files (dir_id)')
+        export_db.execute('CREATE INDEX digests_by_norm ON digests (norm_digest)')
+        export_db.execute('CREATE INDEX marks_by_file ON marks (file_id)')
+        export_db.execute('CREATE INDEX objrefs_by_target ON objrefs (dir_id, ref_name COLLATE NOCASE)')
+        export_db.execute('CREATE INDEX objrefs_by_file ON objrefs (file_id)')
+        export_db.commit()
+        export_db.close()
+        export_db = None
+        currentUmask = os.umask(0)
+        os.umask(currentUmask)
+        os.chmod(exportTempFileSpec, 0o666 & ~currentUmask)
+        os.replace(exportTempFileSpec, sqlite_filename)
+        atexit.unregister(discardExports)
+
+def discardExports():
+    # an unfinished export: its temp database goes unless a checkpoint needs it
+    global jsonl_fp
+    global export_db
+    if jsonl_fp is not None:
+        jsonl_fp.discard()
+        jsonl_fp = None
+    if export_db is not None:
+        export_db.close()
+        export_db = None
+        if not exportKeepPartial:
+            for tempFileSpec in sqliteFilesOf(exportTempFileSpec):
+                os.remove(tempFileSpec)
+
+def sqliteFilesOf(dbFileSpec):
+    # -> the database and whichever of its journal files exist
+    return [fileSpec for fileSpec in (dbFileSpec, dbFileSpec + '-wal', dbFileSpec + '-shm', dbFileSpec + '-journal') if os.path.exists(fileSpec)]
+
+# -----------------------------------------------------------------------------
+#  Scan state (incremental rescans)
+# -----------------------------------------------------------------------------
+#  For every folder we keep its mtime_ns and link count (a cheap child
+#  count that is available from stat()) plus what we found in it.  When a
+#  folder still matches on a later run we reuse its listing instead of
+#  re-reading it.  Neither value changes when a file is merely rewritten
+#  or when a deeper folder changes, so the spin files of a reused folder
+#  are still stat()ed (and rehashed if changed) and its sub-folders are
+#  still visited.
+opt_saveState = False
+stateFileVersion = 1
+priorDirStateByRelDir = {}
+newDirStateByRelDir = {}
+stateReusedDirCount = 0
+
+def relativeToRoot(fileSpec):
+    if fileSpec == root_dirspec:
+        return '.'
+    # os.path.join() adds the separator only when the root ('/') lacks one
+    return fileSpec[len(os.path.join(root_dirspec, '')):]
+
+def loadScanState(stateFileSpec):
+    global priorDirStateByRelDir
+    import json
+    try:
+        with open(stateFileSpec, 'r') as state_fp:
+            scanState = json.load(state_fp)
+    except FileNotFoundError:
+        print_line('No prior scan state [{}], doing a full scan'.format(stateFileSpec), info=True)
+        return False
+    except (OSError, ValueError) as ex:
+        print_line('Ignoring unreadable scan state [{}]: {}'.format(stateFileSpec, ex), warning=True)
+        return False
+    if scanState.get('version') != stateFileVersion or scanState.get('digest') != digest_name:
+        print_line('Ignoring scan state [{}]: made by another version or digest'.format(stateFileSpec), warning=True)
+        return False
+    if scanState.get('ignore', []) != ignoreRuleTexts():
+        print_line('Ignoring scan state [{}]: made with other ignore rules'.format(stateFileSpec), warning=True)
+        return False
+    if scanState.get('zips', False) != opt_zips:
+        # its folders would list archives as files, or as folders, not as we do
+        print_line('Ignoring scan state [{}]: made {} --zips'.format(stateFileSpec, 'with' if scanState.get('zips', False) else 'without'), warning=True)
+        return False
+    priorDirStateByRelDir = scanState.get('dirs', {})
+    return True
+
+def saveScanState(stateFileSpec):
+    import json
+    scanState = {'version': stateFileVersion, 'digest': digest_name, 'root': root_dirspec, 'dirs': newDirStateByRelDir}
+    if ignoreRules is not None:
+        scanState['ignore'] = ignoreRuleTexts()
+    if opt_zips:
+        scanState['zips'] = True
+    # an interrupted run keeps the prior state
+    state_fp = AtomicOutputFile(stateFileSpec, output_buffer_size)
+    json.dump(scanState, state_fp, separators=(',', ':'))
+    state_fp.close()
+
+def rememberDirState(dirSpec, fileSpecList, folderSpecList, spinFileEntries, digestByFilename, dirStat=None, nbrPruned=0):
+    try:
+        if dirStat is None:
+            dirStat = statOfSpec(dirSpec)
+        spinFiles = {}
+        for entry in spinFileEntries:
+            statInfo = entry.stat()
+            spinFiles[entry.name] = [statInfo.st_size, statInfo.st_mtime_ns, digestByFilename.get(entry.name, '')]
+    except OSError:
+        return
+    newDirStateByRelDir[relativeToRoot(dirSpec)] = {
+        'mtime_ns': dirStat.st_mtime_ns,
+        'nlink': dirStat.st_nlink,
+        'files': fileSpecList,
+        'folders': folderSpecList,
+        'spin': spinFiles,
+    }
+    if nbrPruned > 0:
+        # not listed, but still counted when this folder is reused
+        newDirStateByRelDir[relativeToRoot(dirSpec)]['pruned'] = nbrPruned
+
+class PriorFileEntry:
+    # just enough of os.DirEntry for our hashing/caching code
+    __slots__ = ('name', 'path', 'statInfo')
+
+    def __init__(self, name, path, statInfo):
+        self.name = name
+        self.path = path
+        self.statInfo = statInfo
+
+    def stat(self):
+        return self.statInfo
+
+def priorContentsOfDir(dirSpec):
+    global stateReusedDirCount
+    global prunedEntryCount
+    priorState = priorDirStateByRelDir.get(relativeToRoot(dirSpec))
+    if priorState is None:
+        return None
+    try:
+        dirStat = statOfSpec(dirSpec)
+    except OSError:
+        return None
+    if dirStat.st_mtime_ns != priorState['mtime_ns'] or dirStat.st_nlink != priorState['nlink']:
+        return None
+    stateReusedDirCount += 1
+    nbrPruned = priorState.get('pruned', 0)
+    prunedEntryCount += nbrPruned
+    fileSpecList = priorState['files']
+    folderSpecList = priorState['folders']
+    digestByFilename = {}
+    spinFileEntries = []
+    changedEntries = []
+    for filename, (size, mtime_ns, md5sum) in priorState['spin'].items():
+        fileSpec = os.path.join(dirSpec, filename)
+        try:
+            statInfo = statOfSpec(fileSpec)
+        except OSError:
+            # vanished without the folder changing?! fall back to a fresh listing
+            return None
+        entry = PriorFileEntry(filename, fileSpec, statInfo)
+        spinFileEntries.append(entry)
+        if statInfo.st_size == size and statInfo.st_mtime_ns == mtime_ns and len(md5sum) > 0 and haveDerivedDataFor(md5sum):
+            digestByFilename[filename] = md5sum
+            # still ours, so keep its digest cache entry too
+            if cacheSeenPaths is not None:
+                cacheSeenPaths.add(os.path.abspath(fileSpec))
+        else:
+            changedEntries.append(entry)
+    countBytesSeen(spinFileEntries)
+    for entry, md5sum in zip(changedEntries, cachedDigestsOfFiles(changedEntries)):
+        digestByFilename[entry.name] = md5sum
+    # record in the original listing order, same as a fresh scan
+    for entry in spinFileEntries:
+        inventory.recordFileDigest(digestByFilename[entry.name], entry.name, entry.path)
+    if opt_saveState:
+        rememberDirState(dirSpec, fileSpecList, folderSpecList, spinFileEntries, digestByFilename, dirStat, nbrPruned)
+    return (fileSpecList, folderSpecList, digestByFilename)
+
+def digestsByRelPath(dirStateByRelDir):
+    digestByRelPath = {}
+    for relDir, dirState in dirStateByRelDir.items():
+        for filename, (size, mtime_ns, md5sum) in dirState['spin'].items():
+            digestByRelPath[os.path.normpath(os.path.join(relDir, filename))] = md5sum
+    return digestByRelPath
+
+def deltaFilenameFor(outputFileSpec):
+    fileBase, fileExt = os.path.splitext(outputFileSpec)
+    return '{}-delta{}'.format(fileBase, fileExt)
+
+def writeDeltaReport(deltaFileSpec):
+    priorDigests = digestsByRelPath(priorDirStateByRelDir)
+    newDigests = digestsByRelPath(newDirStateByRelDir)
+    addedPaths = [relPath for relPath in newDigests if relPath not in priorDigests]
+    removedPaths = [relPath for relPath in priorDigests if relPath not in newDigests]
+    modifiedPaths = [relPath for relPath in newDigests if relPath in priorDigests and newDigests[relPath] != priorDigests[relPath]]
+    # a removed file whose content reappears under a new path was renamed/moved
+    addedPathsByDigest = {}
+    for relPath in sorted(addedPaths, key=str.casefold):
+        addedPathsByDigest.setdefault(newDigests[relPath], []).append(relPath)
+    renamedPairs = []
+    for relPath in sorted(removedPaths, key=str.casefold):
+        possPaths = addedPathsByDigest.get(priorDigests[relPath])
+        if possPaths:
+            renamedPairs.append((relPath, possPaths.pop(0)))
+    renamedFrom = set(oldPath for oldPath, newPath in renamedPairs)
+    renamedTo = set(newPath for oldPath, newPath in renamedPairs)
+    addedPaths = [relPath for relPath in addedPaths if relPath not in renamedTo]
+    removedPaths = [relPath for relPath in removedPaths if relPath not in renamedFrom]
+
+    delta_fp = AtomicOutputFile(deltaFileSpec, output_buffer_size)
+    delta_fp.write('Changes since prior scan of FOLDER:\n Root {}:\n {}:\n'.format(os.path.dirname(root_dirspec), os.path.basename(root_dirspec)))
+    delta_fp.write('\tAdded ({}):\n'.format(len(addedPaths)))
+    for relPath in sorted(addedPaths, key=str.casefold):
+        delta_fp.write('\t\t- {}\n'.format(relPath))
+    delta_fp.write('\tRemoved ({}):\n'.format(len(removedPaths)))
+    for relPath in sorted(removedPaths, key=str.casefold):
+        delta_fp.write('\t\t- {}\n'.format(relPath))
+    delta_fp.write('\tRenamed ({}):\n'.format(len(renamedPairs)))
+    for oldPath, newPath in renamedPairs:
+        delta_fp.write('\t\t- {} -> {}\n'.format(oldPath, newPath))
+    delta_fp.write('\tModified ({}):\n'.format(len(modifiedPaths)))
+    for relPath in sorted(modifiedPaths, key=str.casefold):
+        delta_fp.write('\t\t- {}  {}:[{}] -> [{}]\n'.format(relPath, digest_name, priorDigests[relPath], newDigests[relPath]))
+    delta_fp.close()
+    print_line('Delta: {} added, {} removed, {} renamed, {} modified -> [{}]'.format(len(addedPaths), len(removedPaths), len(renamedPairs), len(modifiedPaths), deltaFileSpec), info=True)
+
+# -----------------------------------------------------------------------------
+#  Checkpoints
+# -----------------------------------------------------------------------------
+#  A long walk saves a checkpoint every checkpoint_interval seconds, taken
+#  between folders: the folders still to walk, all we've learned so far
+#  and how far each output file had got.  Those partial outputs are kept
+#  should we be stopped, and --resume carries on from the last checkpoint,
+#  cutting them back to it first, so the files it finishes are the same
+#  as an uninterrupted run's.  The checkpoint is a pickle of our own state
+#  in '<output>.checkpoint', only resumed with the same listing options,
+#  and removed once the run completes.  Each checkpoint rewrites all we've
+#  learned so far, about 160 bytes and 10us per spin file found (100k
+#  files: 16MB written in about a second), so at the default interval a
+#  walk spends under 2% of its time on them.  Not taken in --batch or
+#  --max-memory runs.
+checkpointVersion = 3
+checkpointFileSpec = ''
+nextCheckpointTime = 0.0
+checkpointedGlobals = ('inventory', 'stagedFiles', 'normDigestByDigest', 'metadataByDigest', 'objectRefsByDigest',
+                       'exportedDigests', 'exportDirId', 'exportFileId', 'runCounts', 'prunedEntryCount', 'bytesSeenCount', 'bytesReadCount',
+                       'newDirStateByRelDir', 'stateReusedDirCount', 'cacheSeenPaths', 'marksAmbiguousByDirName', 'marksFoundDirByDirName')
+
+def loadCheckpoint(forResume=True):
+    # -> the checkpoint, or None (forResume: None unless we can carry it on)
+    import pickle
+
+    class CheckpointUnpickler(pickle.Unpickler):
+        # our own classes come from this module whether the run that saved
+        #  them ran us as a script or imported us, never from a second copy
+        def find_class(self, module, name):
+            if module in ('__main__', 'mkSpinList') and isinstance(globals().get(name), type):
+                return globals()[name]
+            return super().find_class(module, name)
+
+    try:
+        with open(checkpointFileSpec, 'rb') as checkpoint_fp:
+            checkpoint = CheckpointUnpickler(checkpoint_fp).load()
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError) as ex:
+        if forResume:
+            print_line('Ignoring unreadable checkpoint [{}]: {}'.format(checkpointFileSpec, ex), warning=True)
+        return None
+    if not forResume:
+        return checkpoint
+    if checkpoint.get('version') != checkpointVersion or checkpoint.get('script') != script_version:
+        print_line('Ignoring checkpoint [{}]: made by another version'.format(checkpointFileSpec), warning=True)
+        return None
+    if checkpoint.get('options') != checkpoint_options:
+        print_line('Ignoring checkpoint [{}]: made with other options'.format(checkpointFileSpec), warning=True)
+        return None
+    for partialOutput in checkpoint['outputs'].values():
+        if partialOutput is not None and (not os.path.exists(partialOutput[0]) or os.path.getsize(partialOutput[0]) < partialOutput[1]):
+            print_line('Ignoring checkpoint [{}]: its partial output [{}] is gone'.format(checkpointFileSpec, partialOutput[0]), warning=True)
+            return None
+    return checkpoint
+
+def discardCheckpoint():
+    # a checkpoint we won't resume, and the partial outputs it kept
+    checkpoint = loadCheckpoint(forResume=False)
+    if checkpoint is not None:
+        for partialOutput in checkpoint['outputs'].values():
+            if partialOutput is not None:
+                # with the journal files of a partial SQLite export
+                for partialFileSpec in sqliteFilesOf(partialOutput[0]):
+                    os.remove(partialFileSpec)
+    if os.path.exists(checkpointFileSpec):
+        os.remove(checkpointFileSpec)
+
+def startCheckpoints(outputFileSpec):
+    # -> the checkpoint to resume from, or None
+    global checkpointFileSpec
+    global nextCheckpointTime
+    checkpointFileSpec = ''
+    if checkpoint_interval <= 0 or outputFileSpec is None or len(batch_filename) > 0 or spill_memory_mb > 0:
+        return None
+    checkpointFileSpec = '{}.checkpoint'.format(outputFileSpec)
+    nextCheckpointTime = time() + checkpoint_interval
+    checkpoint = loadCheckpoint() if opt_resume else None
+    if checkpoint is None:
+        if opt_resume:
+            print_line('No checkpoint to resume [{}], doing a full scan'.format(checkpointFileSpec), info=True)
+        discardCheckpoint()
+        return None
+    print_line('Resuming from checkpoint [{}]: {} folders to go'.format(checkpointFileSpec, len(checkpoint['folderStack'])), info=True)
+    return checkpoint
+
+def resumeCheckpoint(checkpoint):
+    globals().update(checkpoint['globals'])
+
+def saveCheckpoint(folderStack, nbrSpinFiles):
+    global nextCheckpointTime
+    global exportKeepPartial
+    import pickle
+    flushDigestCache()
+    outputs = {'listing': write_fp.checkpoint(), 'jsonl': jsonl_fp.checkpoint() if jsonl_fp is not None else None, 'sqlite': None}
+    if export_db is not None:
+        flushExportRows()
+        export_db.commit()
+        # the database is whole at each commit, there is no offset to cut back to
+        exportKeepPartial = True
+        outputs['sqlite'] = (exportTempFileSpec, 0)
+    checkpoint = {
+        'version': checkpointVersion,
+        'script': script_version,
+        'options': checkpoint_options,
+        'folderStack': folderStack,
+        'nbrSpinFiles': nbrSpinFiles,
+        'outputs': outputs,
+        'globals': {globalName: globals()[globalName] for globalName in checkpointedGlobals},
+    }
+    # being stopped mid-write keeps the prior one
+    startTime = perf_counter()
+    checkpoint_fp = AtomicOutputFile(checkpointFileSpec, output_buffer_size, binary=True)
+    pickle.dump(checkpoint, checkpoint_fp, protocol=pickle.HIGHEST_PROTOCOL)
+    checkpoint_fp.close()
+    print_line('Checkpoint: {} folders to go, {} bytes in {:.3f}s [{}]'.format(len(folderStack), os.path.getsize(checkpointFileSpec), perf_counter() - startTime, checkpointFileSpec), verbose=True)
+    nextCheckpointTime = time() + checkpoint_interval
+
+def finishCheckpoints():
+    global checkpointFileSpec
+    if len(checkpointFileSpec) > 0 and os.path.exists(checkpointFileSpec):
+        os.remove(checkpointFileSpec)
+    checkpointFileSpec = ''
+
+# -----------------------------------------------------------------------------
+#  Normalized digests
+# -----------------------------------------------------------------------------
+#  OBEX copies of the same object often differ only by line endings,
+#  encoding or trailing blanks.  While a file is being hashed its bytes are
+#  also streamed through an incremental decoder and a line normalizer whose
+#  output feeds a second hasher, so this costs no extra I/O.
+normDigestByDigest = {}
+normPendingRows = []
+
+def latin1Fallback(decodeError):
+    # bytes that aren't valid UTF-8 are taken as Latin-1, so a Latin-1 copy
+    #  normalizes to the same text as its UTF-8 twin
+    badBytes = decodeError.object[decodeError.start:decodeError.end]
+    return (bytes(badBytes).decode('latin-1'), decodeError.end)
+
+codecs.register_error('spinLatin1', latin1Fallback)
+
+def spinTextEncodingOf(headBytes):
+    # -> (encoding, errors) to decode a spin file starting with headBytes
+    #  (its first 3 bytes will do): old Propeller Tool files are often
+    #  UTF-16, the rest UTF-8 (BOM dropped) or Latin-1
+    if headBytes.startswith(b'\xff\xfe') or headBytes.startswith(b'\xfe\xff'):
+        return ('utf-16', 'replace')
+    if headBytes.startswith(b'\xef\xbb\xbf'):
+        return ('utf-8-sig', 'spinLatin1')
+    return ('utf-8', 'spinLatin1')
+
+def spinTextDecoderFor(headBytes):
+    encoding, errors = spinTextEncodingOf(headBytes)
+    return codecs.getincrementaldecoder(encoding)(errors=errors)
+
+# outside comments only these matter: strings, line comments, {..} and {{..}}
+spinCommentMarkPattern = re.compile(r"\{\{|\}\}|[{}'\"]")
+
+def normalizedMode():
+    return '{}:{}'.format(digest_name, 'nocomments' if opt_stripComments else 'text')
+
+def haveDerivedDataFor(digest):
+    # a cached or remembered digest is only enough if we also have whatever
+    #  else this run works out in the same read
+    return ((not opt_normalize or haveNormalizedDigestFor(digest)) and (not opt_metadata or haveMetadataFor(digest))
+            and (not opt_deps or haveObjectRefsFor(digest)))
+
+def haveNormalizedDigestFor(digest):
+    if digest in normDigestByDigest:
+        return True
+    if cache_db is not None:
+        row = cache_db.execute('SELECT norm_digest FROM normdigests WHERE digest = ? AND norm_mode = ?', (digest, normalizedMode())).fetchone()
+        if row is not None:
+            normDigestByDigest[digest] = row[0]
+            return True
+    return False
+
+class SpinNormalizer:
+    # feed() raw file bytes as read, finish() returns the normalized digest
+    __slots__ = ('hasher', 'decoder', 'pendingText', 'stripComments', 'blockDepth', 'inDocComment')
+
+    def __init__(self, stripComments):
+        self.hasher = newHasher()
+        self.decoder = None
+        self.pendingText = ''
+        self.stripComments = stripComments
+        self.blockDepth = 0
+        self.inDocComment = False
+
+    def feed(self, data):
+        if self.decoder is None:
+            self.decoder = spinTextDecoderFor(bytes(data[:3]))
+        self.addText(self.decoder.decode(data))
+
+    def finish(self):
+        if self.decoder is not None:
+            self.addText(self.decoder.decode(b'', final=True))
+        lastLines = self.pendingText.replace('\r', '\n').split('\n')
+        if len(lastLines) > 1 and len(lastLines[-1]) == 0:
+            lastLines.pop()
+        if len(lastLines[0]) > 0 or len(lastLines) > 1:
+            self.addLines(lastLines)
+        return self.hasher.hexdigest()
+
+    def addText(self, text):
+        text = self.pendingText + text
+        # hold back a trailing CR, its LF may arrive with the next read
+        heldCR = text.endswith('\r')
+        if heldCR:
+            text = text[:-1]
+        lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        self.pendingText = lines.pop() + ('\r' if heldCR else '')
+        if len(lines) > 0:
+            self.addLines(lines)
+
+    def addLines(self, lines):
+        keptLines = []
+        for line in lines:
+            if self.stripComments:
+                line = self.withoutComments(line).rstrip()
+                if len(line) == 0:
+                    continue
+            keptLines.append(line.rstrip())
+        if len(keptLines) > 0:
+            self.hasher.update('{}\n'.format('\n'.join(keptLines)).encode('utf-8', errors='surrogatepass'))
+
+    def withoutComments(self, line):
+        # ' and '' run to end of line, { } nest, {{ }} only end at }}
+        keptParts = []
+        keepFrom = 0 if self.blockDepth == 0 and not self.inDocComment else -1
+        for match in spinCommentMarkPattern.finditer(line):
+            if match.start() < keepFrom:
+                continue    # inside a string we already kept
+            mark = match.group()
+            if self.inDocComment:
+                if mark == '}}':
+                    self.inDocComment = False
+                    keepFrom = match.end()
+            elif self.blockDepth > 0:
+                if mark.startswith('{'):
+                    self.blockDepth += len(mark)
+                elif mark.startswith('}'):
+                    self.blockDepth = max(0, self.blockDepth - len(mark))
+                    if self.blockDepth == 0:
+                        keepFrom = match.end()
+            elif mark == '"':
+                stringEnd = line.find('"', match.end())
+                stringEnd = len(line) if stringEnd < 0 else stringEnd + 1
+                keptParts.append(line[keepFrom:stringEnd])
+                keepFrom = stringEnd
+            elif mark == "'":
+                keptParts.append(line[keepFrom:match.start()])
+                keepFrom = -1
+                break
+            elif mark == '{{':
+                keptParts.append(line[keepFrom:match.start()])
+                self.inDocComment = True
+            elif mark == '{':
+                keptParts.append(line[keepFrom:match.start()])
+                self.blockDepth = 1
+        if keepFrom >= 0 and self.blockDepth == 0 and not self.inDocComment:
+            keptParts.append(line[keepFrom:])
+        return ''.join(keptParts)
+
+# -----------------------------------------------------------------------------
+#  Spin structure metadata
+# -----------------------------------------------------------------------------
+#  With --metadata every chunk the hasher reads is also handed to a light
+#  structure scanner, so certification stats cost no extra I/O.  Chunks
+#  are decoded like the normalizer does (UTF-16, UTF-8 or Latin-1) and the
+#  text gets a few regex passes per chunk:
+#   - sections are CON/VAR/OBJ/PUB/PRI/DAT keywords at the start of a line
+#     (text before the first one is Spin's implicit CON section),
+#   - code lines are lines that aren't blank or ' comments; those in DAT
+#     sections count as PASM (and data), the rest as spin,
+#   - Spin2-ness compares hits on Spin2-only and Spin1-only built-ins;
+#     DEBUG counts only as a 'debug(' statement, Spin1 code often has a
+#     'debug' object (debug.str(...)).
+#  {..} block comments are not tracked, so a section keyword at the start
+#  of a line inside one is counted: this is a survey, not a compiler.
+metadataByDigest = {}
+metadataPendingRows = []
+# cached metadata, the table is renamed when what we count changes
+metadataCacheTable = 'spinmeta3'
+
+spinSectionPattern = re.compile(r'^(con|var|obj|pub|pri|dat)(?![a-z0-9_])', re.I | re.M)
+spinNonCodeLinePattern = re.compile(r"^[ \t]*(?:'.*)?$", re.M)
+spin2MarkerPattern = re.compile(r'(?<![a-z0-9_])(?:pinwrite|pinlow|pinhigh|pintoggle|pinfloat|pinread|pinstart|pinclear|wrpin|wxpin|wypin|akpin|rdpin|rqpin|waitms|waitus|getct|getms|getsec|cogspin|orgh|rdfast|wrfast|getrnd|spin2_v\d+)(?![a-z0-9_])'
+                                r'|^[ \t]*debug[ \t]*\(', re.I | re.M)
+spin1MarkerPattern = re.compile(r'(?<![a-z0-9_])(?:waitcnt|waitpeq|waitpne|waitvid|cognew|ctra|ctrb|frqa|frqb|phsa|phsb|vcfg|vscl|_clkmode|_xinfreq)(?![a-z0-9_])', re.I)
+# 'name : "file"', 'name[4] : "file"' and Spin2's 'name : "file" | PARAM = 1',
+#  also right after the OBJ keyword on its own line
+spinObjectRefPattern = re.compile(r'^[ \t]*(?:obj[ \t]+)?([a-z_][a-z0-9_]*)[ \t]*(?:\[[^\]\n]*\][ \t]*)?:[ \t]*"([^"\n]+)"', re.I | re.M)
+
+class SpinMetadata:
+    # counts for one file's content (kept by digest, like the digest itself)
+    __slots__ = ('lines', 'con', 'var', 'obj', 'pub', 'pri', 'dat', 'spinLines', 'pasmLines', 'spin2Hits', 'spin1Hits')
+
+    def __init__(self, *counts):
+        for fieldName, count in zip(self.__slots__, counts or (0,) * len(self.__slots__)):
+            setattr(self, fieldName, count)
+
+    def add(self, other):
+        for fieldName in self.__slots__:
+            setattr(self, fieldName, getattr(self, fieldName) + getattr(other, fieldName))
+
+    def pasmRatio(self):
+        codeLines = self.spinLines + self.pasmLines
+        return self.pasmLines / codeLines if codeLines > 0 else 0.0
+
+    def looksSpin2(self):
+        return self.spin2Hits > self.spin1Hits
+
+    def asRow(self):
+        return tuple(getattr(self, fieldName) for fieldName in self.__slots__)
+
+    def asDict(self):
+        metadataDict = {fieldName: getattr(self, fieldName) for fieldName in self.__slots__}
+        metadataDict['pasmRatio'] = round(self.pasmRatio(), 4)
+        metadataDict['looksSpin2'] = self.looksSpin2()
+        return metadataDict
+
+class SpinStructureScanner:
+    # feed() raw file bytes as read, finish() returns the file's SpinMetadata
+    __slots__ = ('metadata', 'section', 'decoder', 'pendingText', 'objectRefs')
+
+    def __init__(self):
+        self.metadata = SpinMetadata()
+        self.section = 'con'
+        self.decoder = None
+        self.pendingText = ''
+        self.objectRefs = []
+
+    def feed(self, data):
+        if self.decoder is None:
+            self.decoder = spinTextDecoderFor(bytes(data[:3]))
+        self.addText(self.decoder.decode(data))
+
+    def finish(self):
+        if self.decoder is not None:
+            self.addText(self.decoder.decode(b'', final=True))
+        lastLine = self.pendingText.replace('\r', '')
+        if len(lastLine) > 0:
+            self.addLines(lastLine + '\n')
+        self.pendingText = ''
+        return self.metadata
+
+    def addText(self, text):
+        text = self.pendingText + text
+        # hold back a trailing CR, its LF may arrive with the next read
+        heldCR = text.endswith('\r')
+        if heldCR:
+            text = text[:-1]
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        # only whole lines are scanned, a partial last line waits for the rest
+        lineEnd = text.rfind('\n') + 1
+        self.pendingText = text[lineEnd:] + ('\r' if heldCR else '')
+        if lineEnd > 0:
+            self.addLines(text[:lineEnd])
+
+    def addLines(self, lines):
+        metadata = self.metadata
+        metadata.lines += lines.count('\n')
+        metadata.spin2Hits += len(spin2MarkerPattern.findall(lines))
+        metadata.spin1Hits += len(spin1MarkerPattern.findall(lines))
+        # count each run of lines toward the section it is in
+        runStart = 0
+        for match in spinSectionPattern.finditer(lines):
+            self.addSectionLines(lines[runStart:match.start()])
+            self.section = match.group(1).lower()
+            setattr(metadata, self.section, getattr(metadata, self.section) + 1)
+            runStart = match.start()
+        self.addSectionLines(lines[runStart:])
+
+    def addSectionLines(self, lines):
+        if len(lines) == 0:
+            return
+        codeLines = lines.count('\n') - len(spinNonCodeLinePattern.findall(lines))
+        # a run of whole lines always ends in LF, so findall's empty match
+        #  after that final LF isn't a line
+        codeLines += 1
+        if self.section == 'dat':
+            self.metadata.pasmLines += codeLines
+        else:
+            self.metadata.spinLines += codeLines
+        if self.section == 'obj':
+            self.objectRefs.extend(spinObjectRefPattern.findall(lines))
+
+def haveMetadataFor(digest):
+    if digest in metadataByDigest:
+        return True
+    if cache_db is not None:
+        row = cache_db.execute('SELECT * FROM {} WHERE digest = ?'.format(metadataCacheTable), (digest,)).fetchone()
+        if row is not None:
+            metadataByDigest[digest] = SpinMetadata(*row[1:])
+            return True
+    return False
+
+# -----------------------------------------------------------------------------
+#  OBJ dependencies
+# -----------------------------------------------------------------------------
+#  With --deps the structure scanner also keeps the (object name, file)
+#  pairs of each OBJ section, by digest like the metadata.  As each folder
+#  is listed these are resolved against the spin files in that folder
+#  (the compilers' rule: no extension means the referencing file's own,
+#  .spin2 or .spin), and the edges go to the SQLite export where --uses
+#  and --unresolved answer questions about the graph without a rescan.
+objectRefsByDigest = {}
+objectRefsPendingRows = []
+# cached references, renamed like the metadata table when the parse changes
+objectRefsCacheTable = 'objrefs2'
+
+def encodeObjectRefs(objectRefs):
+    # cache row: 'name<TAB>file' lines
+    return '\n'.join('{}\t{}'.format(objName, objFile) for objName, objFile in objectRefs)
+
+def haveObjectRefsFor(digest):
+    if digest in objectRefsByDigest:
+        return True
+    if cache_db is not None:
+        row = cache_db.execute('SELECT refs FROM {} WHERE digest = ?'.format(objectRefsCacheTable), (digest,)).fetchone()
+        if row is not None:
+            objectRefsByDigest[digest] = tuple(tuple(refLine.split('\t', 1)) for refLine in row[0].split('\n') if len(refLine) > 0)
+            return True
+    return False
+
+def resolveObjectRefs(filename, objectRefs, siblingByFoldedName):
+    # -> [{'obj': name, 'ref': file as written, 'file': sibling filename or None}, ...]
+    ownExtension = os.path.splitext(filename)[1]
+    resolvedRefs = []
+    for objName, objFile in objectRefs:
+        refName = objFile.replace('\\', '/').rsplit('/', 1)[-1]
+        if not isSpinFile(refName):
+            refName += ownExtension
+        resolvedRefs.append({'obj': objName, 'ref': objFile, 'file': siblingByFoldedName.get(refName.casefold())})
+    return resolvedRefs
+
+def queryDependencies(exportFileSpec):
+    import sqlite3
+    query_db = sqlite3.connect('file:{}?mode=ro'.format(exportFileSpec), uri=True)
+    if query_db.execute("SELECT name FROM sqlite_master WHERE name = 'objrefs'").fetchone() is None:
+        print_line('ERROR: [{}] has no dependency graph, export it with --deps --sqlite'.format(exportFileSpec), error=True)
+        return 1
+    if 'dir_id' not in [row[1] for row in query_db.execute('PRAGMA table_info(objrefs)')]:
+        # older exports joined folders by their listing label, export it again
+        print_line('ERROR: [{}] has an older dependency graph, export it again with --deps --sqlite'.format(exportFileSpec), error=True)
+        return 1
+    if len(uses_objectspec) > 0:
+        objName, _, digestPrefix = uses_objectspec.partition(':')
+        # everything that reaches NAME through OBJ references, then just the
+        #  top-level ones: those no other file in their folder uses
+        usersRows = query_db.execute('''
+            WITH RECURSIVE
+            targets AS (
+                SELECT file_id, dir_id, name, path FROM files
+                    WHERE name = ? COLLATE NOCASE AND digest LIKE ? || '%'),
+            users(file_id, dir_id, name, path) AS (
+                SELECT * FROM targets
+                UNION
+                SELECT files.file_id, files.dir_id, files.name, files.path FROM users
+                    JOIN objrefs ON objrefs.dir_id = users.dir_id AND objrefs.ref_name = users.name COLLATE NOCASE
+                    JOIN files ON files.file_id = objrefs.file_id)
+            SELECT path FROM users
+                WHERE file_id NOT IN (SELECT file_id FROM targets)
+                AND NOT EXISTS (SELECT 1 FROM objrefs WHERE objrefs.dir_id = users.dir_id AND objrefs.ref_name = users.name COLLATE NOCASE)
+            ''', (objName, digestPrefix)).fetchall()
+        print_line('Top-level objects using [{}]: {}'.format(uses_objectspec, len(usersRows)), info=True)
+        for userPath in sorted((row[0] for row in usersRows), key=str.casefold):
+            print(userPath)
+    if opt_unresolved:
+        unresolvedRows = query_db.execute('''
+            SELECT dirs.path, files.name, objrefs.ref FROM objrefs
+                JOIN files ON files.file_id = objrefs.file_id
+                JOIN dirs ON dirs.dir_id = objrefs.dir_id
+                WHERE objrefs.ref_name IS NULL
+                ORDER BY objrefs.dir_id, files.file_id, objrefs.rowid
+            ''').fetchall()
+        print_line('Unresolved OBJ references: {} in {} folder(s)'.format(len(unresolvedRows), len(set(row[0] for row in unresolvedRows))), info=True)
+        for dirPath, filename, objFile in unresolvedRows:
+            print('{}\t{}\t"{}"'.format(dirPath, filename, objFile))
+    query_db.close()
+    return 0
+
+def isSpinFile(fileSpec):
+    foundSpinStatus = False
+    if fileSpec.lower().endswith('spin2') or fileSpec.lower().endswith('spin'):
+        foundSpinStatus = True
+    return foundSpinStatus
+
+def isSpinFilesInList(fileSpecList):
+    foundSpinStatus = False
+    if len(fileSpecList) > 0:
+        for filename in fileSpecList:
+            if isSpinFile(filename):
+                foundSpinStatus = True
+                break
+    return foundSpinStatus
+
+def spinFilesInList(fileSpecList):
+    spinFileSpecList = []
+    for filename in fileSpecList:
+        if filename.endswith('spin2') or filename.endswith('spin'):
+            spinFileSpecList.append(filename)
+    return spinFileSpecList
+
+def listFilenames(fileSpecList, containerDir, depth, digestByFilename, dirSpec):
+    baseDirName = os.path.basename(containerDir)
+    spinFileList = spinFilesInList(fileSpecList)
+    if len(spinFileList) > 0 and not baseDirName.startswith('.'):
+        dirNbr = inventory.countDirectory(containerDir)
+        writeFinding('\n {:0>3d}-{}:  {}:'.format(dirNbr, depth, containerDir))
+        dirId = None
+        if opt_export:
+            dirId = exportDirectory(dirNbr, depth, containerDir, relativeToRoot(dirSpec))
+        sortedList = sorted(spinFileList, key=str.casefold)
+        siblingByFoldedName = {filename.casefold(): filename for filename in sortedList} if opt_deps else None
+        for filename in sortedList:
+            priorPhase = phaseClock.switch('marks')
+            fileDeetsDict = getMarksFor(containerDir, filename)
+            phaseClock.switch(priorPhase)
+            runCounts['marksLookups'] += 1
+            if len(fileDeetsDict) > 0:
+                runCounts['marksFound'] += 1
+            fileDoneFlag = ''
+            fileNotes = []
+            if len(fileDeetsDict) > 0:
+                if markKeyDone in fileDeetsDict.keys():
+                    doneStr = fileDeetsDict[markKeyDone]
+                    fileDoneFlag = ' {}'.format(doneStr)
+                if markKeyNotes in fileDeetsDict.keys():
+                    fileNotes = fileDeetsDict[markKeyNotes]
+            countStr = inventory.countFilename(filename)
+            fileDigest = digestByFilename.get(filename, '')
+            exportRecord = None
+            if opt_export:
+                filenameCount = inventory.filenameCountOf(filename)
+                exportRecord = {
+                    'dirId': dirId,
+                    'dirNbr': dirNbr,
+                    'dir': containerDir,
+                    'name': filename,
+                    'path': relativeToRoot(os.path.join(dirSpec, filename)),
+                    'fileNbr': filenameCount.fileNbr,
+                    'seen': filenameCount.nbrSeen,
+                    'done': fileDeetsDict.get(markKeyDone),
+                    'notes': fileNotes,
+                }
+            if opt_deps and not isinstance(fileDigest, StagedFile):
+                objectRefs = resolveObjectRefs(filename, objectRefsByDigest.get(fileDigest, ()), siblingByFoldedName)
+                inventory.recordObjectRefs(containerDir, objectRefs)
+                if exportRecord is not None:
+                    exportRecord['objs'] = objectRefs
+            if isinstance(fileDigest, StagedFile):
+                fileDigest.containerDir = containerDir
+                fileDigest.exportRecord = exportRecord
+            else:
+                inventory.recordFileFolder(filename, fileDigest, containerDir)
+                if exportRecord is not None:
+                    exportFile(exportRecord, fileDigest)
+            writeFinding('\t\t- {} [{}]{}'.format(filename, countStr, fileDoneFlag))
+            if len(fileNotes) > 0:
+                for noteTxt in fileNotes:
+                    writeFinding('\t\t\t- {}'.format(noteTxt))
+        if opt_export:
+            exportDirectoryDone()
+
+def genFileListFromFolder(startingDirSpec, depth, dirParent, folderStack=None, nbrSpinFiles=0):
+    # depth-first, pre-order walk using an explicit stack so very deep trees
+    #  can't hit the recursion limit; children are pushed in reverse so they
+    #  pop off in our case-folded sort order (a resumed walk passes in the
+    #  stack it checkpointed)
+    global folderPrefetcher
+    if folderStack is None:
+        folderStack = [(startingDirSpec, depth, dirParent)]
+    if walk_jobs > 0:
+        folderPrefetcher = FolderPrefetcher(walk_jobs)
+    while len(folderStack) > 0:
+        dirSpec, dirDepth, dirParentName = folderStack.pop()
+        if folderPrefetcher is not None:
+            # list what comes next while this folder is digested
+            folderPrefetcher.prefetch(folderStack)
+        runCounts['dirs'] += 1
+        baseDirName = os.path.basename(dirSpec)
+        print_line('Scanning folder=[{}]   {}'.format(baseDirName, dirSpec), verbose=True)
+        fileSpecList, folderSpecList, digestByFilename = contentsOfDir(dirSpec)
+        nbrSpinFiles += len(digestByFilename)
+        progress.advance(1, '{} spin files'.format(nbrSpinFiles))
+        print_line('--', debug=True)
+        # process files within dir
+        topDirName = baseDirName
+        if baseDirName == 'All':
+            topDirName = ''
+        subDirParent = ''
+        if isSpinFilesInList(fileSpecList):
+            containerDir = topDirName
+            if len(dirParentName) > 0:
+                containerDir = os.path.join(dirParentName, topDirName)
+            listFilenames(fileSpecList, containerDir, dirDepth, digestByFilename, dirSpec)
+        else:
+            subDirParent = topDirName
+        if len(folderSpecList) > 0:
+            sortedFolderNameList = sorted(folderSpecList, key=str.casefold)
+            for dirname in reversed(sortedFolderNameList):
+                folderStack.append((os.path.join(dirSpec, dirname), dirDepth+1, subDirParent))
+        if folderPrefetcher is not None:
+            folderPrefetcher.prefetch(folderStack)
+        if len(checkpointFileSpec) > 0 and time() >= nextCheckpointTime and len(folderStack) > 0:
+            saveCheckpoint(folderStack, nbrSpinFiles)
+    if folderPrefetcher is not None:
+        folderPrefetcher.close()
+        folderPrefetcher = None
+
+# -----------------------------------------------------------------------------
+#  Inventory model
+# -----------------------------------------------------------------------------
+class FilenameCount:
+    # how often a filename has been listed, and the nbr it was first given
+    __slots__ = ('fileNbr', 'nbrSeen')
+
+    def __init__(self, fileNbr):
+        self.fileNbr = fileNbr
+        self.nbrSeen = 0
+
+    def countStr(self):
+        return '{},{}'.format(self.fileNbr, self.nbrSeen)
+
+class Inventory:
+    # everything we learn while scanning, every update is O(1)
+    #  countByFilename:    filename -> FilenameCount
+    #  dirNbrByDirname:    listed folder -> folder nbr (1..n, in listing order)
+    #  filenamesByDigest:  digest -> {filename: None, ...}
+    #     (a dict used as an insertion-ordered set so the report lists the
+    #      names in the order we found them)
+    #  versionsByFilename: filename -> {digest: [listed folder, ...], ...}
+    #     (the reverse of filenamesByDigest, one entry per unique version)
+    #  pathByDigest:       digest -> path of the first file found with it
+    #  metadataByDigest:   digest -> SpinMetadata (with --metadata)
+    #  nbrObjectRefs:      OBJ references seen (with --deps)
+    #  unresolvedByDir:    listed folder -> {file as referenced: None, ...}
+    __slots__ = ('countByFilename', 'dirNbrByDirname', 'filenamesByDigest', 'versionsByFilename', 'pathByDigest', 'metadataByDigest',
+                 'nbrObjectRefs', 'unresolvedByDir')
+
+    def __init__(self):
+        self.countByFilename = {}
+        self.dirNbrByDirname = {}
+        self.filenamesByDigest = {}
+        self.versionsByFilename = {}
+        self.pathByDigest = {}
+        self.metadataByDigest = {}
+        self.nbrObjectRefs = 0
+        self.unresolvedByDir = {}
+
+    def recordFileDigest(self, digest, filename, fileSpec=''):
+        if len(digest) > 0 and len(filename) > 0:
+            filenames = self.filenamesByDigest.get(digest)
+            if filenames is None:
+                filenames = {}
+                self.filenamesByDigest[digest] = filenames
+                self.pathByDigest[digest] = fileSpec
+                if digest in metadataByDigest:
+                    self.metadataByDigest[digest] = metadataByDigest[digest]
+            filenames[filename] = None
+            versions = self.versionsByFilename.get(filename)
+            if versions is None:
+                versions = {}
+                self.versionsByFilename[filename] = versions
+            if digest not in versions:
+                versions[digest] = []
+        else:
+            print_line('recordFileDigest!: EMPTY FIELD! digest=[{}], filename=[{}]'.format(digest, filename), error=True)
+
+    def recordObjectRefs(self, containerDir, objectRefs):
+        self.nbrObjectRefs += len(objectRefs)
+        for objectRef in objectRefs:
+            if objectRef['file'] is None:
+                self.unresolvedByDir.setdefault(containerDir, {})[objectRef['ref']] = None
+
+    def countFilename(self, newFilename):
+        countStr = ''
+        if len(newFilename) > 0:
+            filenameCount = self.countByFilename.get(newFilename)
+            if filenameCount is None:
+                filenameCount = FilenameCount(len(self.countByFilename) + 1)
+                self.countByFilename[newFilename] = filenameCount
+            filenameCount.nbrSeen += 1
+            countStr = filenameCount.countStr()
+        return countStr
+
+    def countDirectory(self, newDir):
+        dirNbr = self.dirNbrByDirname.get(newDir)
+        if dirNbr is None:
+            dirNbr = len(self.dirNbrByDirname) + 1
+            self.dirNbrByDirname[newDir] = dirNbr
+        return dirNbr
+
+    def recordFileFolder(self, filename, digest, containerDir):
+        versions = self.versionsByFilename.get(filename)
+        if versions is not None and digest in versions:
+            versions[digest].append(containerDir)
+
+    def versionDigestsOfFilename(self, filename):
+        return list(self.versionsByFilename.get(filename, {}).keys())
+
+    def foldersOfVersion(self, filename, digest):
+        return self.versionsByFilename.get(filename, {}).get(digest, [])
+
+    def countOfUniqFilesNamed(self, filename):
+        fileCount = len(self.versionsByFilename.get(filename, {}))
+        if (fileCount == 0):
+            print_line('countOfUniq??: filename=[{}], fileCount=[{}]'.format(filename, fileCount), warning=True)
+        return fileCount
+
+    def filenameCountOf(self, filename):
+        return self.countByFilename[filename]
+
+    def nbrDirectories(self):
+        return len(self.dirNbrByDirname)
+
+    def nbrFilenames(self):
+        return len(self.countByFilename)
+
+    def nbrDigests(self):
+        return len(self.filenamesByDigest)
+
+    def nbrFilesSeen(self):
+        return sum(filenameCount.nbrSeen for filenameCount in self.countByFilename.values())
+
+    def digestsWithManyNames(self):
+        for digest, filenames in self.filenamesByDigest.items():
+            if len(filenames) > 1:
+                yield (digest, filenames)
+
+    def reportBuckets(self, dirname, basename):
+        return ReportBuckets(dirname, basename)
+
+    def close(self):
+        pass
+
+# -----------------------------------------------------------------------------
+#  With --max-memory the same inventory lives in a SQLite file instead
+#  (in --spill-dir), with its page cache held to about half the budget.
+#  Rows keep our first-seen order in their rowids, and the report reads
+#  its sorted sections through indexes built once the walk is done, so
+#  SQLite does the sorting on disk rather than us in memory.  The folders
+#  of each version are only kept for --versions, the one report using
+#  them.  Marks stay in memory, they only hold the files that have some.
+class SpilledInventory(Inventory):
+    __slots__ = ('store_db', 'storeFileSpec')
+
+    def __init__(self, memoryMb, spillDirSpec):
+        super().__init__()
+        import sqlite3
+        import tempfile
+        fd, self.storeFileSpec = tempfile.mkstemp(dir=spillDirSpec if len(spillDirSpec) > 0 else None, prefix='mkSpinList-', suffix='.sqlite')
+        os.close(fd)
+        atexit.register(self.close)
+        print_line('Inventory store [{}], {} MB budget'.format(self.storeFileSpec, memoryMb), verbose=True)
+        self.store_db = sqlite3.connect(self.storeFileSpec)
+        self.store_db.execute('PRAGMA journal_mode=OFF')
+        self.store_db.execute('PRAGMA synchronous=OFF')
+        self.store_db.execute('PRAGMA temp_store=FILE')
+        self.store_db.execute('PRAGMA cache_size={}'.format(-max(memoryMb * 1024 // 2, 1024)))
+        self.store_db.execute('CREATE TABLE filenames (file_nbr INTEGER PRIMARY KEY, name TEXT UNIQUE, nbr_seen INTEGER, sort_key TEXT)')
+        self.store_db.execute('CREATE TABLE dirs (dir_nbr INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        self.store_db.execute('CREATE TABLE digests (seq INTEGER PRIMARY KEY, digest TEXT UNIQUE, path TEXT, nbr_names INTEGER)')
+        self.store_db.execute('CREATE TABLE versions (seq INTEGER PRIMARY KEY, name TEXT, digest TEXT, UNIQUE (name, digest))')
+        self.store_db.execute('CREATE TABLE folders (name TEXT, digest TEXT, folder TEXT)')
+        self.store_db.execute('CREATE INDEX folders_by_version ON folders (name, digest)')
+
+    def recordFileDigest(self, digest, filename, fileSpec=''):
+        if len(digest) > 0 and len(filename) > 0:
+            self.store_db.execute('INSERT OR IGNORE INTO digests (digest, path, nbr_names) VALUES (?, ?, 0)', (digest, fileSpec))
+            if self.store_db.execute('INSERT OR IGNORE INTO versions (name, digest) VALUES (?, ?)', (filename, digest)).rowcount > 0:
+                self.store_db.execute('UPDATE digests SET nbr_names = nbr_names + 1 WHERE digest = ?', (digest,))
+        else:
+            print_line('recordFileDigest!: EMPTY FIELD! digest=[{}], filename=[{}]'.format(digest, filename), error=True)
+
+    def countFilename(self, newFilename):
+        countStr = ''
+        if len(newFilename) > 0:
+            row = self.store_db.execute('SELECT file_nbr, nbr_seen FROM filenames WHERE name = ?', (newFilename,)).fetchone()
+            if row is None:
+                fileNbr = self.store_db.execute('INSERT INTO filenames (name, nbr_seen, sort_key) VALUES (?, 1, ?)', (newFilename, newFilename.casefold())).lastrowid
+                nbrSeen = 1
+            else:
+                fileNbr, nbrSeen = row[0], row[1] + 1
+                self.store_db.execute('UPDATE filenames SET nbr_seen = ? WHERE file_nbr = ?', (nbrSeen, fileNbr))
+            countStr = '{},{}'.format(fileNbr, nbrSeen)
+        return countStr
+
+    def countDirectory(self, newDir):
+        row = self.store_db.execute('SELECT dir_nbr FROM dirs WHERE name = ?', (newDir,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.store_db.execute('INSERT INTO dirs (name) VALUES (?)', (newDir,)).lastrowid
+
+    def recordFileFolder(self, filename, digest, containerDir):
+        if opt_versions:
+            self.store_db.execute('INSERT INTO folders VALUES (?, ?, ?)', (filename, digest, containerDir))
+
+    def versionDigestsOfFilename(self, filename):
+        return [row[0] for row in self.store_db.execute('SELECT digest FROM versions WHERE name = ? ORDER BY seq', (filename,))]
+
+    def foldersOfVersion(self, filename, digest):
+        return [row[0] for row in self.store_db.execute('SELECT folder FROM folders WHERE name = ? AND digest = ? ORDER BY rowid', (filename, digest))]
+
+    def countOfUniqFilesNamed(self, filename):
+        fileCount = self.store_db.execute('SELECT count(*) FROM versions WHERE name = ?', (filename,)).fetchone()[0]
+        if (fileCount == 0):
+            print_line('countOfUniq??: filename=[{}], fileCount=[{}]'.format(filename, fileCount), warning=True)
+        return fileCount
+
+    def filenameCountOf(self, filename):
+        fileNbr, nbrSeen = self.store_db.execute('SELECT file_nbr, nbr_seen FROM filenames WHERE name = ?', (filename,)).fetchone()
+        filenameCount = FilenameCount(fileNbr)
+        filenameCount.nbrSeen = nbrSeen
+        return filenameCount
+
+    def nbrDirectories(self):
+        return self.store_db.execute('SELECT count(*) FROM dirs').fetchone()[0]
+
+    def nbrFilenames(self):
+        return self.store_db.execute('SELECT count(*) FROM filenames').fetchone()[0]
+
+    def nbrDigests(self):
+        return self.store_db.execute('SELECT count(*) FROM digests').fetchone()[0]
+
+    def nbrFilesSeen(self):
+        return self.store_db.execute('SELECT coalesce(sum(nbr_seen), 0) FROM filenames').fetchone()[0]
+
+    def digestsWithManyNames(self):
+        digestRows = self.store_db.execute('SELECT digest FROM digests WHERE nbr_names > 1 ORDER BY seq')
+        for digestRow in digestRows:
+            yield (digestRow[0], [row[0] for row in self.store_db.execute('SELECT name FROM versions WHERE digest = ? ORDER BY seq', digestRow)])
+
+    def reportBuckets(self, dirname, basename):
+        # sorted once, on disk, into indexes the report then reads in order
+        self.store_db.execute('CREATE INDEX IF NOT EXISTS filenames_by_name ON filenames (sort_key, file_nbr)')
+        self.store_db.execute('CREATE INDEX IF NOT EXISTS filenames_by_count ON filenames (nbr_seen, sort_key, file_nbr)')
+        self.store_db.execute('CREATE INDEX IF NOT EXISTS versions_by_digest ON versions (digest, seq)')
+        return SpilledReportBuckets(self.store_db, dirname, basename)
+
+    def close(self):
+        if self.store_db is not None:
+            self.store_db.close()
+            self.store_db = None
+            os.remove(self.storeFileSpec)
+            atexit.unregister(self.close)
+
+inventory = Inventory()
+
+# -----------------------------------------------------------------------------
+#  Near-duplicate detection
+# -----------------------------------------------------------------------------
+#  Each unique spin source is normalized (lower-cased, comments dropped,
+#  runs of blanks squeezed to one) and reduced to one token per non-blank
+#  line; tokenizing per line keeps this at C speed, which matters on the
+#  whole OBEX.  Runs of similarShingleSize line tokens are shingled and
+#  summarized with a one-permutation MinHash: every shingle is hashed once
+#  and the smallest hash per bin is kept.  Signatures are then split into
+#  bands, files sharing any band land in the same LSH bucket, and only those
+#  candidate pairs get compared - there is no all-pairs pass.
+similarShingleSize = 2
+similarBinCount = 64
+similarBandRows = 4
+similarHashMask = (1 << 64) - 1
+similarDensifyStep = 0x9e3779b97f4a7c15
+
+spinCommentPattern = re.compile(r"\{\{.*?\}\}|\{.*?\}|'[^\n]*", re.S)
+spinBlanksPattern = re.compile(r'[ \t\f\v]+')
+
+def decodeSpinText(fileBytes):
+    encoding, errors = spinTextEncodingOf(fileBytes[:3])
+    return fileBytes.decode(encoding, errors=errors)
+
+def spinLineTokensOf(spinText):
+    normalizedText = spinBlanksPattern.sub(' ', spinCommentPattern.sub(' ', spinText.lower()))
+    lines = [line.strip() for line in normalizedText.splitlines()]
+    # crc32 (not hash()) so tokens don't depend on PYTHONHASHSEED
+    return [zlib.crc32(line.encode('utf-8', errors='replace')) for line in lines if len(line) > 0]
+
+def similarSignatureOfFile(fileSpec):
+    try:
+        with openSpinFile(fileSpec) as file_fp:
+            fileBytes = file_fp.read()
+    except zipReadErrors as ex:
+        print_line('similarSignatureOfFile!: failed to read [{}]: {}'.format(fileSpec, ex), warning=True)
+        return None
+    lineTokens = spinLineTokensOf(decodeSpinText(fileBytes))
+    if len(lineTokens) < similarShingleSize:
+        return None
+    shingles = set(zip(*(lineTokens[offset:] for offset in range(similarShingleSize))))
+    # tuple-of-int hashing is deterministic (unlike str hashing); walking the
+    #  hashes largest first leaves the smallest one in each bin
+    shingleHashes = sorted((hash(shingle) & similarHashMask for shingle in shingles), reverse=True)
+    minHashByBin = {shingleHash % similarBinCount: shingleHash for shingleHash in shingleHashes}
+    signature = [minHashByBin.get(binNbr) for binNbr in range(similarBinCount)]
+    if len(minHashByBin) < similarBinCount:
+        # densify: an empty bin borrows from the next filled one (offset by the
+        #  distance) so short files still compare fairly bin for bin
+        for binNbr in range(similarBinCount):
+            if signature[binNbr] is None:
+                distance = 1
+                while minHashByBin.get((binNbr + distance) % similarBinCount) is None:
+                    distance += 1
+                signature[binNbr] = (minHashByBin[(binNbr + distance) % similarBinCount] + distance * similarDensifyStep) & similarHashMask
+    return tuple(signature)
+
+def estimatedSimilarity(signature1, signature2):
+    return sum(map(operator.eq, signature1, signature2)) / similarBinCount
+
+def findSimilarFiles(minSimilarity):
+    digests = list(inventory.pathByDigest.keys())
+    fileSpecs = [inventory.pathByDigest[digest] for digest in digests]
+    signatures = mapOnPool(similarSignatureOfFile, fileSpecs)
+    signatureByDigest = {digest: signature for digest, signature in zip(digests, signatures) if signature is not None}
+
+    # LSH: bucket every band of every signature, pairs come only from shared buckets
+    digestsByBand = {}
+    for digest, signature in signatureByDigest.items():
+        for bandStart in range(0, similarBinCount, similarBandRows):
+            band = signature[bandStart:bandStart+similarBandRows]
+            digestsByBand.setdefault((bandStart, band), []).append(digest)
+    candidatePairs = set()
+    for bucketDigests in digestsByBand.values():
+        for index, digest1 in enumerate(bucketDigests):
+            for digest2 in bucketDigests[index+1:]:
+                candidatePairs.add((digest1, digest2))
+    similarPairs = []
+    for digest1, digest2 in candidatePairs:
+        similarity = estimatedSimilarity(signatureByDigest[digest1], signatureByDigest[digest2])
+        if similarity >= minSimilarity:
+            similarPairs.append((similarity, digest1, digest2))
+    print_line('Similar: {} signatures, {} LSH candidate pairs, {} similar pairs'.format(len(signatureByDigest), len(candidatePairs), len(similarPairs)), verbose=True)
+    return similarPairs
+
+def describeDigest(digest):
+    filename = next(iter(inventory.filenamesByDigest[digest]))
+    folders = inventory.foldersOfVersion(filename, digest)
+    if len(folders) > 0:
+        return '{} [{}]'.format(filename, folders[0])
+    return '{} [{}]'.format(filename, relativeToRoot(os.path.dirname(inventory.pathByDigest[digest])))
+
+# main code from here!
+
+# -----------------------------------------------------------------------------
+#  Marks file records
+# -----------------------------------------------------------------------------
+#  A marks file is one of our listings, marked up in TaskPaper:
+#      <SPACE>NNN-D:  folder:
+#      <TAB><TAB>- file.spin2 [N,M] @done(2023-01-02)
+#      <TAB><TAB><TAB>- a note
+#  Folder lines may also be tab-led, and the ' [N,M]' counts we list after
+#  each file name are not part of the name.
+#  marksRecordsOf() turns lines into one typed record per line, lazily, so
+#  a marks file is never held in memory.  Every record keeps its line as
+#  read (line ending included), so writeMarksFile() given unmodified
+#  records reproduces the file byte for byte; records made by hand (line
+#  None) are written in the form above.  Files are read and written as
+#  UTF-8 with undecodable bytes carried through as-is (surrogateescape).
+class MarksLine:
+    # any other line: titles, blank lines, stats...
+    __slots__ = ('line',)
+
+    def __init__(self, line):
+        self.line = line
+
+    def text(self):
+        return self.line
+
+class MarksDir(MarksLine):
+    __slots__ = ('dirName',)
+
+    def __init__(self, dirName, line=None):
+        self.line = line
+        self.dirName = dirName
+
+    def text(self):
+        return self.line if self.line is not None else '\t{}:\n'.format(self.dirName)
+
+class MarksFile(MarksLine):
+    __slots__ = ('fileName', 'doneMark')
+
+    def __init__(self, fileName, doneMark=None, line=None):
+        self.line = line
+        self.fileName = fileName
+        # '@done(...)' as written in the file, None when not done
+        self.doneMark = doneMark
+
+    def text(self):
+        if self.line is not None:
+            return self.line
+        if self.doneMark is not None:
+            return '\t\t- {} {}\n'.format(self.fileName, self.doneMark)
+        return '\t\t- {}\n'.format(self.fileName)
+
+class MarksNote(MarksLine):
+    __slots__ = ('note',)
+
+    def __init__(self, note, line=None):
+        self.line = line
+        self.note = note
+
+    def text(self):
+        return self.line if self.line is not None else '\t\t\t- {}\n'.format(self.note)
+
+# the ' [N,M]' (file nbr, times found) our listing puts after a file name
+marksFileCountSuffix = re.compile(r'\s+\[\d+,\d+\]$')
+
+def openMarksFile(marksFileSpec):
+    # newline='' hands us lines with their own line endings, untranslated
+    return open(marksFileSpec, 'r', encoding='utf-8', errors='surrogateescape', newline='')
+
+def marksRecordsOf(markLines):
+    # markLines: any iterable of lines, e.g. an openMarksFile() file object
+    for markLine in markLines:
+        if markLine.endswith('\r\n'):
+            content = markLine[:-2]
+        elif markLine.endswith('\n') or markLine.endswith('\r'):
+            content = markLine[:-1]
+        else:
+            content = markLine
+        # notes and files first: either may end in ':' like a folder line
+        if len(content) == 0:
+            yield MarksLine(markLine)
+        elif content.startswith('\t\t\t- '):
+            yield MarksNote(content.strip()[2:], markLine)
+        elif content.startswith('\t\t- '):
+            fileName = content.strip()[2:]
+            doneMark = None
+            if '@done' in fileName:
+                # name without its done mark, and the mark itself
+                fileParts = fileName.strip().split('@done')
+                fileName = fileParts[0].strip()
+                doneMark = '@done{}'.format(fileParts[1].strip())
+            yield MarksFile(marksFileCountSuffix.sub('', fileName), doneMark, markLine)
+        elif (content.startswith('\t') or content.startswith(' ')) and content.endswith(':'):
+            yield MarksDir(content.strip()[:-1], markLine)
+        else:
+            yield MarksLine(markLine)
+
+def writeMarksFile(marksFileSpec, marksRecords):
+    marks_fp = AtomicOutputFile(marksFileSpec, output_buffer_size, encoding='utf-8', errors='surrogateescape', newline='')
+    for record in marksRecords:
+        marks_fp.write(record.text())
+    marks_fp.close()
+
+# -----------------------------------------------------------------------------
+#  Marks
+# -----------------------------------------------------------------------------
+#  marks of each listed file, by folder then filename:
+#    {'001-2:  Acc': {'b.spin2': {'Done': '@done(2023-01-02)', 'Notes': ['checked ok']}}}
+marksByDirByFilename = {}
+
+markKeyDone = 'Done'
+markKeyNotes = 'Notes'
+
+debugDir = '?xyzzy?'  #'4-bit Parallel LCD driver'
+
+# marks index, built once the marks file is loaded (see buildMarksIndex())
+#  marksDirByLabel:      'Acc_Buttons' -> ['001-2:  Acc_Buttons', ...]
+#  marksDirsByComponent: 'Acc_Buttons' -> {'001-2:  Acc_Buttons', ...}
+marksDirByLabel = {}
+marksDirsByComponent = {}
+marksDirOrder = {}
+marksFoundDirByDirName = {}
+marksAmbiguousByDirName = {}
+
+# our own listing prefixes each folder with its ' NNN-D:  ' number and depth
+marksDirNbrPrefix = re.compile(r'^\d+-\d+:\s+')
+
+def labelOfMarksDir(marksDirName):
+    return marksDirNbrPrefix.sub('', marksDirName, count=1)
+
+def buildMarksIndex():
+    marksDirByLabel.clear()
+    marksDirsByComponent.clear()
+    marksDirOrder.clear()
+    marksFoundDirByDirName.clear()
+    for dirIndex, marksDirName in enumerate(marksByDirByFilename.keys()):
+        marksDirOrder[marksDirName] = dirIndex
+        dirLabel = labelOfMarksDir(marksDirName)
+        marksDirByLabel.setdefault(dirLabel, []).append(marksDirName)
+        for component in dirLabel.split('/'):
+            marksDirsByComponent.setdefault(component, set()).add(marksDirName)
+    print_line('marks: indexed {} folders, {} labels, {} components'.format(len(marksDirOrder), len(marksDirByLabel), len(marksDirsByComponent)), debug=True)
+
+def findMarksDirFor(dirName):
+    # 1) perfect match on the marks folder line itself
+    if dirName in marksByDirByFilename:
+        return dirName
+    # 2) match on the folder name once our listing number is removed
+    candidates = marksDirByLabel.get(dirName, [])
+    # 3) partial match: marks folders holding every path component of dirName
+    if len(candidates) == 0:
+        componentSets = [marksDirsByComponent.get(component) for component in dirName.split('/')]
+        if len(componentSets) > 0 and all(componentSets):
+            possDirNames = set.intersection(*componentSets)
+            candidates = sorted((possDirName for possDirName in possDirNames if dirName in possDirName), key=marksDirOrder.get)
+    if len(candidates) == 0:
+        return ''
+    if len(candidates) > 1:
+        # first one (in marks file order) wins, report the rest at end of run
+        marksAmbiguousByDirName[dirName] = candidates
+    return candidates[0]
+
+def getMarksFor(dirName, filename):
+    #showDebug = False
+    showDebug = (dirName == debugDir)
+    # resolve each listed folder only once, every file in it reuses the answer
+    if dirName in marksFoundDirByDirName:
+        foundDirName = marksFoundDirByDirName[dirName]
+    else:
+        foundDirName = findMarksDirFor(dirName)
+        marksFoundDirByDirName[dirName] = foundDirName
+    if showDebug:
+        print_line('(SD!) marks: found [{}] for [{}]'.format(foundDirName, dirName), warning=True)
+    fileDeets = {}
+    if len(foundDirName) > 0:
+        fileDeets = marksByDirByFilename[foundDirName].get(filename, {})
+    if showDebug:
+        print_line('getMarksFor({}//{}): [{}]'.format(dirName, filename, fileDeets), info=True)
+    return fileDeets
+
+def reportAmbiguousMarks():
+    for dirName, possDirNames in marksAmbiguousByDirName.items():
+        print_line('marks: dirName=[{}] MATCHes MORE than one, used 1st! {}'.format(dirName, ', '.join('[{}]'.format(possDirName) for possDirName in possDirNames)), error=True)
+    if len(marksAmbiguousByDirName) > 0:
+        print_line('marks: {} folder(s) had ambiguous marks matches'.format(len(marksAmbiguousByDirName)), error=True)
+
+def debugShowMarks():
+    #print_line('      marksByDirByFilename=[{}]'.format(marksByDirByFilename), warning=True)
+    for dirName in marksByDirByFilename.keys():
+        print_line('marks: -- {} --'.format(dirName), info=True)
+        fileMarksByFilename = marksByDirByFilename[dirName]
+        for fileName in fileMarksByFilename.keys():
+            fileDetails = fileMarksByFilename[fileName]
+            print_line('        {}:   [{}]'.format(fileName, fileDetails), info=True)
+
+def clearMarks():
+    marksByDirByFilename.clear()
+    marksAmbiguousByDirName.clear()
+    buildMarksIndex()
+
+def loadMarks(marksFileSpec):
+    # ---------------------------------------------------
+    #  load prior marks so we can merge them with new
+    # ---------------------------------------------------
+    clearMarks()
+    print_line('Copying marks from [{}]'.format(marksFileSpec), info=True)
+    markDir = ''
+    markFile = ''
+    fileMarks = {}
+    fileMarksByFilename = {}
+    with openMarksFile(marksFileSpec) as marks_fp:
+        for record in marksRecordsOf(marks_fp):
+            if isinstance(record, MarksDir):
+                # save our list of files for the prior dir, then start this one
+                if len(fileMarksByFilename) > 0 and len(markDir) > 0:
+                    marksByDirByFilename[markDir] = fileMarksByFilename
+                    if markDir == debugDir:
+                        print_line('marks: dirName=[{}] = [{}]'.format(markDir, fileMarksByFilename), info=True)
+                fileMarksByFilename = {}
+                markDir = record.dirName
+                markFile = ''
+                print_line('marks: markDir=[{}]'.format(markDir), debug=True)
+            elif isinstance(record, MarksFile):
+                # a file is only kept once it has a done mark or a note
+                markFile = record.fileName
+                fileMarks = {}
+                if record.doneMark is not None and len(markFile) > 0:
+                    fileMarks[markKeyDone] = record.doneMark
+                    fileMarksByFilename[markFile] = fileMarks
+                if markDir == debugDir:
+                    print_line('marks: markFile=[{}],  markMarks=[{}]'.format(markFile, fileMarks), info=True)
+            elif isinstance(record, MarksNote):
+                # notes belong to the file above them, stray notes are dropped
+                if len(markFile) > 0:
+                    fileMarks.setdefault(markKeyNotes, []).append(record.note)
+                    fileMarksByFilename[markFile] = fileMarks
+                print_line('marks: note=[{}]'.format(record.note), debug=True)
+    if len(fileMarksByFilename) > 0 and len(markDir) > 0:
+        marksByDirByFilename[markDir] = fileMarksByFilename
+
+    buildMarksIndex()
+    #debugShowMarks()
+
+def settleDigestMode():
+    global opt_fullDigests
+    global cacheSeenPaths
+    global exportedDigests
+    exporting = len(jsonl_filename) > 0 or len(sqlite_filename) > 0
+    if not opt_fullDigests and (opt_normalize or opt_metadata or opt_deps or opt_versions or len(state_filename) > 0 or exporting):
+        # these show or keep the digest of every file, so every file gets one
+        print_line('Digesting all files (needed by --normalized, --metadata, --deps, --versions, --state, --jsonl or --sqlite)', verbose=True)
+        opt_fullDigests = True
+    if spill_memory_mb > 0 and cacheSeenPaths is not None:
+        # staging keeps every file until the walk ends, the export and the
+        #  cache eviction would keep every digest or path seen: digest each
+        #  folder as we go, let the export drop repeats, don't evict
+        print_line('Memory-bounded: digesting all files, digest cache entries are not evicted', verbose=True)
+        opt_fullDigests = True
+        cacheSeenPaths = None
+        exportedDigests = None
+
+def listRoot(rootDirSpec, marksFileSpec, outputFileSpec):
+    global root_dirspec
+    global inventory
+    global write_fp
+    global opt_saveState
+    global priorDirStateByRelDir
+    global newDirStateByRelDir
+    global stateReusedDirCount
+    global bytesSeenCount
+    global bytesReadCount
+    global prunedEntryCount
+    # main() and scan() callers both get here with only the options set
+    settleDigestMode()
+    # 'P1-OBEX/' is 'P1-OBEX': every path under the root is root + os.sep + ...
+    root_dirspec = rootDirSpec.rstrip(os.sep) or os.sep
+    # a library caller may still be using the last one, so only now let it go
+    inventory.close()
+    inventory = SpilledInventory(spill_memory_mb, spill_dirspec) if spill_memory_mb > 0 else Inventory()
+    stagedFiles.clear()
+    bytesSeenCount = 0
+    bytesReadCount = 0
+    prunedEntryCount = 0
+    opt_saveState = False
+    priorDirStateByRelDir = {}
+    newDirStateByRelDir = {}
+    stateReusedDirCount = 0
+
+    priorPhase = phaseClock.switch('marks')
+    checkpoint = startCheckpoints(outputFileSpec)
+    if outputFileSpec is not None:
+        write_fp = AtomicOutputFile(outputFileSpec, output_buffer_size, output_flush_interval,
+                                    resumeFrom=checkpoint['outputs']['listing'] if checkpoint is not None else None)
+        print_line('Writing output to [{}]'.format(outputFileSpec), info=True)
+    else:
+        write_fp = NullOutputFile()
+    if len(marksFileSpec) > 0:
+        loadMarks(marksFileSpec)
+    else:
+        clearMarks()
+    phaseClock.switch('walk')
+
+    dirname = os.path.dirname(root_dirspec)
+    basename = os.path.basename(root_dirspec)
+    if checkpoint is None:
+        writeFinding('Spin/Spin2 files in FOLDER:\n Root {}:\n {}:'.format(dirname, basename))
+    havePriorState = False
+    if len(state_filename) > 0:
+        opt_saveState = True
+        print_line('Using scan state [{}]'.format(state_filename), info=True)
+        havePriorState = loadScanState(state_filename)
+    openExports(checkpoint)
+    priorWalkSize = len(priorDirStateByRelDir) if havePriorState else priorWalkSizeOf(root_dirspec)
+    progress.start('Walking', priorWalkSize, 'folders')
+    try:
+        if checkpoint is not None:
+            resumeCheckpoint(checkpoint)
+            genFileListFromFolder(root_dirspec, 1, '', checkpoint['folderStack'], checkpoint['nbrSpinFiles'])
+        else:
+            genFileListFromFolder(root_dirspec, 1, '')
+    except RootUnreadableError:
+        # an empty listing must not replace the last good one
+        progress.finish()
+        write_fp.discard()
+        discardExports()
+        raise
+    progress.finish()
+    rememberWalkSize(root_dirspec, progress.done)
+    if not opt_fullDigests:
+        resolveStagedDigests()
+    closeExports()
+    evictDigestCache(root_dirspec)
+    phaseClock.switch('marks')
+    reportAmbiguousMarks()
+    phaseClock.switch('walk')
+    if opt_saveState:
+        if havePriorState:
+            print_line('Scan state: reused {} of {} folders'.format(stateReusedDirCount, len(newDirStateByRelDir)), info=True)
+            if outputFileSpec is not None:
+                writeDeltaReport(deltaFilenameFor(outputFileSpec))
+        saveScanState(state_filename)
+
+    phaseClock.switch('report')
+    writeReport(dirname, basename)
+    write_fp.close()
+    finishCheckpoints()
+    closeZipArchives()
+    phaseClock.switch(priorPhase)
+    runCounts['roots'] += 1
+    runCounts['spinFiles'] += inventory.nbrFilesSeen()
+    runCounts['bytesSeen'] += bytesSeenCount
+    runCounts['bytesRead'] += bytesReadCount
+    runCounts['pruned'] += prunedEntryCount
+    print_line('Read {} of {} bytes of spin files ({:.1f}%)'.format(bytesReadCount, bytesSeenCount, (100.0 * bytesReadCount / bytesSeenCount) if bytesSeenCount > 0 else 0.0), info=True)
+
+# -----------------------------------------------------------------------------
+#  Report sections
+# -----------------------------------------------------------------------------
+#  The report is a list of named sections, each a generator of lines that
+#  are written as they are yielded, so nothing is built up first.  Every
+#  section gets the same ReportBuckets, made in one pass over the listing:
+#  the filenames in our case-folded order and, per times found, the names
+#  found that many times (each bucket in that same order).  Add a section
+#  by putting (name, generator, enabled-check or None) in reportSections;
+#  --sections picks which of them are written.
+class ReportBuckets:
+    __slots__ = ('dirname', 'basename', 'sortedFilenames', 'filenamesByCount')
+
+    def __init__(self, dirname, basename):
+        self.dirname = dirname
+        self.basename = basename
+        self.sortedFilenames = sorted(inventory.countByFilename.keys(), key=str.casefold)
+        self.filenamesByCount = {}
+        for filename in self.sortedFilenames:
+            fileCount = inventory.countByFilename[filename].nbrSeen
+            filenames = self.filenamesByCount.get(fileCount)
+            if filenames is None:
+                filenames = []
+                self.filenamesByCount[fileCount] = filenames
+            filenames.append(filename)
+
+    def filenameCounts(self):
+        # -> (filename, times found), ...
+        for filename in self.sortedFilenames:
+            yield (filename, inventory.countByFilename[filename].nbrSeen)
+
+    def repeatedGroups(self, largestFirst=False):
+        # -> (times found, [filename, ...]), ... for names found more than once
+        for fileCount in sorted((fileCount for fileCount in self.filenamesByCount if fileCount > 1), reverse=largestFirst):
+            yield (fileCount, self.filenamesByCount[fileCount])
+
+class SpilledReportBuckets:
+    # the same, read in index order from a SpilledInventory's store
+    __slots__ = ('dirname', 'basename', 'store_db')
+
+    def __init__(self, store_db, dirname, basename):
+        self.dirname = dirname
+        self.basename = basename
+        self.store_db = store_db
+
+    def filenameCounts(self):
+        yield from self.store_db.execute('SELECT name, nbr_seen FROM filenames ORDER BY sort_key, file_nbr')
+
+    def repeatedGroups(self, largestFirst=False):
+        countRows = self.store_db.execute('SELECT name, nbr_seen FROM filenames WHERE nbr_seen > 1 ORDER BY nbr_seen {}, sort_key, file_nbr'.format('DESC' if largestFirst else 'ASC'))
+        import itertools
+        for fileCount, countGroup in itertools.groupby(countRows, key=operator.itemgetter(1)):
+            yield (fileCount, (row[0] for row in countGroup))
+
+def statsSection(buckets):
+    yield 'Stats for FOLDER:\n Root {}:\n {}:'.format(buckets.dirname, buckets.basename)
+    yield '\t{} directories containing: '.format(inventory.nbrDirectories())
+    yield '\t\t{} Unique filenames'.format(inventory.nbrFilenames())
+    yield '\t\t({} Unique files where content is diff.)'.format(inventory.nbrDigests())
+    if opt_normalize:
+        normDigests = set(normDigestByDigest.get(md5sum, md5sum) for md5sum in inventory.filenamesByDigest)
+        yield '\t\t({} Unique files after normalization)'.format(len(normDigests))
+    if ignoreRules is not None:
+        yield '\t({} files and folders pruned by ignore rules)'.format(prunedEntryCount)
+
+def alphabeticalSection(buckets):
+    yield 'Alphabetical list of files with nbr of times found:'
+    for filename, fileCount in buckets.filenameCounts():
+        yield '\t{}x {}'.format(fileCount, filename)
+
+def repeatedSection(buckets):
+    yield 'Alphabetical list of files appearing more than once:'
+    foundOne = False
+    for fileCount, filenames in buckets.repeatedGroups():
+        yield '\tFiles appearing {} times:'.format(fileCount)
+        for filename in filenames:
+            uniqCount = inventory.countOfUniqFilesNamed(filename)
+            yield '\t\t{}  ({} unique versions)'.format(filename, uniqCount)
+            if opt_versions:
+                for md5sum in inventory.versionDigestsOfFilename(filename):
+                    folderList = ' '.join('[{}]'.format(folder) for folder in inventory.foldersOfVersion(filename, md5sum))
+                    yield '\t\t\t{}:[{}]  in: {}'.format(digest_name, md5sum, folderList)
+            foundOne = True
+    if not foundOne:
+        yield '\t-- No files appearing more than once --'
+
+def topDuplicatedSection(buckets):
+    # largest buckets first, so only the top report_top_count names are visited
+    yield 'Top {} most duplicated files:'.format(report_top_count)
+    nbrShown = 0
+    for fileCount, filenames in buckets.repeatedGroups(largestFirst=True):
+        for filename in filenames:
+            if nbrShown >= report_top_count:
+                return
+            yield '\t{}x {}  ({} unique versions)'.format(fileCount, filename, inventory.countOfUniqFilesNamed(filename))
+            nbrShown += 1
+    if nbrShown == 0:
+        yield '\t-- No files appearing more than once --'
+
+def multipleNamesSection(buckets):
+    yield 'Identical files with more than one name:'
+    foundOne = False
+    for md5sum, fileNames in inventory.digestsWithManyNames():
+        yield '\t{} Files with {}:[{}]:'.format(len(fileNames), digest_name, md5sum)
+        for filename in fileNames:
+            uniqCount = inventory.countOfUniqFilesNamed(filename)
+            yield '\t\t{}  ({} unique versions)'.format(filename, uniqCount)
+            foundOne = True
+    if not foundOne:
+        yield '\t-- No files found with more than one name --'
+
+def normalizedSection(buckets):
+    yield 'Semantically identical files (differ only in encoding, line endings, trailing blanks{}):'.format(', comments' if opt_stripComments else '')
+    digestsByNormDigest = {}
+    for md5sum in inventory.filenamesByDigest:
+        if md5sum in normDigestByDigest:
+            digestsByNormDigest.setdefault(normDigestByDigest[md5sum], []).append(md5sum)
+    foundOne = False
+    for normDigest, md5sums in digestsByNormDigest.items():
+        if len(md5sums) > 1:
+            yield '\t{} versions with normalized {}:[{}]:'.format(len(md5sums), digest_name, normDigest)
+            for md5sum in md5sums:
+                yield '\t\t{}  {}:[{}]'.format(describeDigest(md5sum), digest_name, md5sum)
+            foundOne = True
+    if not foundOne:
+        yield '\t-- No semantically identical files found --'
+
+def structureSection(buckets):
+    yield 'Spin structure of unique files:'
+    totals = SpinMetadata()
+    for metadata in inventory.metadataByDigest.values():
+        totals.add(metadata)
+    yield '\t{} lines, {} spin / {} DAT (PASM) code lines ({:.0f}% PASM)'.format(totals.lines, totals.spinLines, totals.pasmLines, 100.0 * totals.pasmRatio())
+    yield '\t{} CON, {} VAR, {} OBJ, {} PUB, {} PRI, {} DAT sections'.format(totals.con, totals.var, totals.obj, totals.pub, totals.pri, totals.dat)
+    yield 'Files named .spin that look like Spin2:'
+    foundOne = False
+    for md5sum, fileNames in inventory.filenamesByDigest.items():
+        metadata = inventory.metadataByDigest.get(md5sum)
+        if metadata is not None and metadata.looksSpin2():
+            for filename in fileNames:
+                if filename.lower().endswith('.spin'):
+                    yield '\t\t{}  {}:[{}]'.format(describeDigest(md5sum), digest_name, md5sum)
+                    foundOne = True
+                    break
+    if not foundOne:
+        yield '\t-- No .spin files look like Spin2 --'
+
+def unresolvedSection(buckets):
+    yield 'Unresolved OBJ references ({} references seen):'.format(inventory.nbrObjectRefs)
+    for containerDir, unresolvedRefs in inventory.unresolvedByDir.items():
+        yield '\t{}: {}'.format(containerDir, ', '.join('"{}"'.format(objFile) for objFile in unresolvedRefs))
+    if len(inventory.unresolvedByDir) == 0:
+        yield '\t-- No unresolved OBJ references --'
+
+def similarSection(buckets):
+    yield 'Similar files (estimated similarity):'
+    describedPairs = []
+    descriptionByDigest = {}
+    for similarity, digest1, digest2 in findSimilarFiles(similarity_min):
+        for digest in (digest1, digest2):
+            if digest not in descriptionByDigest:
+                descriptionByDigest[digest] = describeDigest(digest)
+        describedPairs.append((similarity, sorted([descriptionByDigest[digest1], descriptionByDigest[digest2]], key=str.casefold)))
+    describedPairs.sort(key=lambda pair: (-round(pair[0] * 100), pair[1][0].casefold(), pair[1][1].casefold()))
+    for similarity, (description1, description2) in describedPairs:
+        yield '\t{:3.0f}%  {}  ~  {}'.format(similarity * 100, description1, description2)
+    if len(describedPairs) == 0:
+        yield '\t-- No similar files found --'
+
+reportSections = [
+    ('stats', statsSection, None),
+    ('alphabetical', alphabeticalSection, None),
+    ('repeated', repeatedSection, None),
+    ('top', topDuplicatedSection, lambda: report_top_count > 0),
+    ('multiname', multipleNamesSection, None),
+    ('normalized', normalizedSection, lambda: opt_normalize),
+    ('structure', structureSection, lambda: opt_metadata),
+    ('unresolved', unresolvedSection, lambda: opt_deps),
+    ('similar', similarSection, lambda: opt_similar),
+]
+
+def writeReport(dirname, basename):
+    buckets = inventory.reportBuckets(dirname, basename)
+    for sectionName, sectionLines, isEnabled in reportSections:
+        if (isEnabled is None or isEnabled()) and (report_section_names is None or sectionName in report_section_names):
+            for line in sectionLines(buckets):
+                writeFinding(line)
+
+# -----------------------------------------------------------------------------
+#  Batch mode (several roots, one process)
+# -----------------------------------------------------------------------------
+#  Roots share our hashing pool and digest cache.  After each root its
+#  unique contents are kept so we can summarize files found under more
+#  than one root once all roots are done.
+crossRootEntries = []
+
+def loadBatchManifest(manifestFileSpec):
+    if manifestFileSpec == '-':
+        manifestLines = sys.stdin.read().splitlines()
+        manifestDir = os.getcwd()
+    else:
+        with open(manifestFileSpec, 'r') as manifest_fp:
+            manifestLines = manifest_fp.read().splitlines()
+        manifestDir = os.path.dirname(os.path.abspath(manifestFileSpec))
+    batchRoots = []
+    for lineNbr, manifestLine in enumerate(manifestLines, 1):
+        if len(manifestLine.strip()) == 0 or manifestLine.lstrip().startswith('#'):
+            continue
+        lineParts = manifestLine.split('\t')
+        if len(lineParts) != 3 or len(lineParts[0]) == 0 or len(lineParts[2]) == 0:
+            print_line('batch: line {} needs root<TAB>marks-file<TAB>output-file: [{}]'.format(lineNbr, manifestLine), error=True)
+            os._exit(1)
+        rootDirSpec, marksFileSpec, outputFileSpec = [os.path.expanduser(linePart.strip()) for linePart in lineParts]
+        if marksFileSpec == '-':
+            marksFileSpec = ''
+        # relative names are relative to the manifest (or cwd for stdin)
+        if len(marksFileSpec) > 0:
+            marksFileSpec = os.path.join(manifestDir, marksFileSpec)
+        batchRoots.append((os.path.join(manifestDir, rootDirSpec), marksFileSpec, os.path.join(manifestDir, outputFileSpec)))
+    return batchRoots
+
+def rememberCrossRootEntries(rootNbr):
+    for md5sum, filenames in inventory.filenamesByDigest.items():
+        fileSpec = inventory.pathByDigest[md5sum]
+        crossRootEntries.append((rootNbr, md5sum, list(filenames), fileSpec, relativeToRoot(fileSpec)))
+
+def sizeOfCrossRootEntry(md5sum, fileSpec):
+    if md5sum.startswith('~'):
+        return int(md5sum[1:].split(':')[0])
+    try:
+        return statOfSpec(fileSpec).st_size
+    except OSError:
+        return -1
+
+def writeCrossRootSummary(batchRoots, summaryFileSpec):
+    # staged stand-in digests are only unique within their own root: any that
+    #  share a size with an entry from another root get a real digest now
+    entriesBySize = {}
+    for entry in crossRootEntries:
+        entriesBySize.setdefault(sizeOfCrossRootEntry(entry[1], entry[3]), []).append(entry)
+    needFull = []
+    for sizeGroup in entriesBySize.values():
+        if len(set(entry[0] for entry in sizeGroup)) > 1:
+            needFull.extend(entry for entry in sizeGroup if entry[1].startswith('~'))
+    realDigestByEntryId = {}
+    for entry, md5sum in zip(needFull, hashFiles([entry[3] for entry in needFull])):
+        realDigestByEntryId[id(entry)] = md5sum
+    entriesByDigest = {}
+    for entry in crossRootEntries:
+        md5sum = realDigestByEntryId.get(id(entry), entry[1])
+        if not md5sum.startswith('~'):
+            entriesByDigest.setdefault(md5sum, []).append(entry)
+    sharedDigests = [md5sum for md5sum, entries in entriesByDigest.items() if len(set(entry[0] for entry in entries)) > 1]
+    sharedDigests.sort(key=lambda md5sum: entriesByDigest[md5sum][0][2][0].casefold())
+
+    summary_fp = AtomicOutputFile(summaryFileSpec, output_buffer_size)
+    summary_fp.write('Spin/Spin2 files found under more than one ROOT:\n Roots:\n')
+    for rootNbr, (rootDirSpec, marksFileSpec, outputFileSpec) in enumerate(batchRoots, 1):
+        summary_fp.write('\t{}: {}\n'.format(rootNbr, rootDirSpec))
+    summary_fp.write(' {} files found under more than one root:\n'.format(len(sharedDigests)))
+    for md5sum in sharedDigests:
+        entries = entriesByDigest[md5sum]
+        fileNames = []
+        for entry in entries:
+            fileNames.extend(filename for filename in entry[2] if filename not in fileNames)
+        summary_fp.write('\t{}  {}:[{}]:\n'.format(', '.join(fileNames), digest_name, md5sum))
+        for entry in entries:
+            summary_fp.write('\t\t- [{}] {}\n'.format(entry[0], entry[4]))
+    if len(sharedDigests) == 0:
+        summary_fp.write('\t-- No files found under more than one root --\n')
+    summary_fp.close()
+    print_line('Batch: {} files found under more than one of {} roots -> [{}]'.format(len(sharedDigests), len(batchRoots), summaryFileSpec), info=True)
+
+# -----------------------------------------------------------------------------
+#  Entry points
+# -----------------------------------------------------------------------------
+#  scan() lets other tooling list a tree in-process.  It runs with our
+#  current settings (the opt_* globals) and, unless output names a file,
+#  writes no listing or delta report.  The Inventory returned holds the
+#  names, counts, folders and digests of every spin file found: every file
+#  gets a real digest, never a '~' stand-in.
+def scan(root, marks=None, output=None):
+    global opt_fullDigests
+    opt_fullDigests = True
+    listRoot(root, marks if marks is not None else '', output)
+    return inventory
+
+def main(argv=None):
+    parseOptions(argv)
+    if len(uses_objectspec) > 0 or opt_unresolved:
+        return queryDependencies(sqlite_filename)
+    profiler = None
+    if len(profile_filename) > 0:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if len(cache_filename) > 0:
+        print_line('Using digest cache [{}]'.format(cache_filename), info=True)
+        openDigestCache(cache_filename)
+
+    try:
+        if len(batch_filename) > 0:
+            batchRoots = loadBatchManifest(batch_filename)
+            for rootNbr, (rootDirSpec, marksFileSpec, outputFileSpec) in enumerate(batchRoots, 1):
+                print_line('Batch: root {} of {} [{}]'.format(rootNbr, len(batchRoots), rootDirSpec), info=True)
+                listRoot(rootDirSpec, marksFileSpec, outputFileSpec)
+                rememberCrossRootEntries(rootNbr)
+            phaseClock.switch('report')
+            writeCrossRootSummary(batchRoots, output_filename)
+        else:
+            listRoot(root_dirspec, from_filename, output_filename)
+    except RootUnreadableError as ex:
+        print_line('ERROR: {}'.format(ex), error=True)
+        return 1
+
+    if hashPool is not None:
+        hashPool.shutdown()
+    closeZipArchives()
+
+    if cache_db is not None:
+        print_line('Digest cache: {} hits, {} misses, {} evicted'.format(cacheHitCount, cacheMissCount, cacheEvictCount), info=True)
+        closeDigestCache()
+    runCounts['cacheHits'] = cacheHitCount
+    runCounts['cacheMisses'] = cacheMissCount
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_filename)
+        print_line('Profile written to [{}] (view with: python3 -m pstats {})'.format(profile_filename, profile_filename), info=True)
+    if opt_stats:
+        printStats()
+    if len(timings_filename) > 0:
+        writeTimings(timings_filename)
+    if runCounts['unreadableArchives'] > 0:
+        print_line('ERROR: {} archive(s) could not be read, their files are missing from the listing'.format(runCounts['unreadableArchives']), error=True)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())